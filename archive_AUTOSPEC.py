@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to write all AUTOSPEC files of a sweep into one archive instead of many small files,
+and to read them back:
+    with ArchiveSink(filename) as sink:
+        make_AUTOSPEC(layersfile,chemfile,mollist,temp,clist,sink=sink)
+    for name,text in iter_archive(filename):
+        (use text)
+    text = read_archive_file(filename,name)
+    extract_archive(filename,outdir)
+
+    python archive_AUTOSPEC.py ARCHIVE [--list] [--extract OUTDIR] [--names NAME [NAME ...]]
+
+Inputs:
+    filename:  path to the archive, the type is set by the extension: .tar, .tar.gz (.tgz),
+               .tar.bz2, .tar.xz or .zip
+    root:  files are stored by their path relative to root (optional, default is only the
+           file name), two files with the same name raise ValueError
+
+Outputs:
+    The archive, and an index next to it (filename + '.index.json') with the name and size of
+    every file in the order they were written (and where its data starts in an uncompressed
+    tar, so single files can be read without going through the archive).
+
+The archive is written to a temporary file and renamed when the sink is closed, so a
+failed run never leaves half an archive under the final name. extract_archive refuses names
+that are absolute or go up a directory (..), so an archive can't write outside outdir.
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+
+from timing_AUTOSPEC import TIMER, logger
+
+
+def archive_mode(filename):
+
+    # Archive type and compression from the file extension
+    if filename.endswith('.zip'):
+        return 'zip',None
+    for ext,comp in (('.tar.gz','gz'),('.tgz','gz'),('.tar.bz2','bz2'),('.tar.xz','xz'),('.tar','')):
+        if filename.endswith(ext):
+            return 'tar',comp
+    raise ValueError('Archive must end with .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz or .zip: '+filename)
+
+
+def check_name(name):
+
+    # Names of files in an archive stay inside the directory they are extracted to
+    if os.path.isabs(name) or '..' in name.replace('\\','/').split('/'):
+        raise ValueError('Name of a file in an archive can\'t be absolute or contain ..: '+name)
+
+
+class ArchiveSink:
+
+    def __init__(self,filename,root=None):
+
+        self.filename = filename
+        self.root = root
+        self.kind,self.comp = archive_mode(filename)
+        self.index = []
+        self.names = set()
+
+        self.tmp = filename+'.tmp'
+        if self.kind == 'zip':
+            self.archive = zipfile.ZipFile(self.tmp,'w',zipfile.ZIP_DEFLATED)
+        elif self.comp == 'gz':
+            self.archive = tarfile.open(self.tmp,'w:gz',compresslevel=6)
+        else:
+            self.archive = tarfile.open(self.tmp,'w:'+self.comp)
+
+
+    def write(self,path,text):
+
+        if self.root is not None:
+            name = os.path.relpath(path,self.root)
+        else:
+            name = os.path.basename(path)
+        check_name(name)
+        # A second file with the same name would hide the first one
+        if name in self.names:
+            raise ValueError('Two files named '+name+' in '+self.filename
+                             +(' (give a root to keep their directories)' if self.root is None else ''))
+        self.names.add(name)
+
+        if not isinstance(text,str):
+            text = ''.join(text)
+        data = text.encode()
+
+        with TIMER.stage('write',name,archive=self.filename):
+            entry = {'name': name,'size': len(data)}
+            if self.kind == 'zip':
+                self.archive.writestr(name,data)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                self.archive.addfile(info,io.BytesIO(data))
+                # Data of an uncompressed tar can be read directly at its offset
+                if self.comp == '':
+                    blocks = (len(data)+tarfile.BLOCKSIZE-1)//tarfile.BLOCKSIZE
+                    entry['offset'] = self.archive.offset-blocks*tarfile.BLOCKSIZE
+            self.index.append(entry)
+        logger.debug('Added %s to %s',name,self.filename)
+
+        # Not written to its own file
+        return None
+
+
+    def close(self):
+
+        if self.archive is None:
+            return
+        self.archive.close()
+        self.archive = None
+
+        with open(self.tmp+'.index.json','w') as f:
+            json.dump({'kind': self.kind,'compression': self.comp,'files': self.index},f)
+        os.replace(self.tmp,self.filename)
+        os.replace(self.tmp+'.index.json',self.filename+'.index.json')
+        logger.info('Created AUTOSPEC archive %s with %d files',self.filename,len(self.index))
+
+
+    def abort(self):
+
+        # Remove the unfinished archive
+        if self.archive is None:
+            return
+        self.archive.close()
+        self.archive = None
+        os.remove(self.tmp)
+
+
+    def __enter__(self):
+
+        return self
+
+
+    def __exit__(self,exc_type,exc,tb):
+
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_index(filename):
+
+    # Index written with the archive, or made by reading the archive if there isn't one
+    try:
+        with open(filename+'.index.json') as f:
+            return json.load(f)
+    except OSError:
+        pass
+
+    kind,comp = archive_mode(filename)
+    if kind == 'zip':
+        with zipfile.ZipFile(filename) as z:
+            files = [{'name': info.filename,'size': info.file_size} for info in z.infolist()]
+    else:
+        with tarfile.open(filename) as tar:
+            files = [{'name': info.name,'size': info.size} for info in tar if info.isfile()]
+
+    return {'kind': kind,'compression': comp,'files': files}
+
+
+def iter_archive(filename):
+
+    # All files in the order they were written, reading the archive once from start to end
+    kind,comp = archive_mode(filename)
+    if kind == 'zip':
+        with zipfile.ZipFile(filename) as z:
+            for info in z.infolist():
+                yield info.filename,z.read(info).decode()
+        return
+
+    with tarfile.open(filename,'r|*') as tar:
+        for info in tar:
+            if info.isfile():
+                yield info.name,tar.extractfile(info).read().decode()
+
+
+def read_archive_file(filename,name):
+
+    kind,comp = archive_mode(filename)
+    if kind == 'zip':
+        with zipfile.ZipFile(filename) as z:
+            return z.read(name).decode()
+
+    # Uncompressed tar: read the data straight from its offset in the index
+    if comp == '':
+        for entry in read_index(filename)['files']:
+            if entry['name'] == name and 'offset' in entry:
+                with open(filename,'rb') as f:
+                    f.seek(entry['offset'])
+                    return f.read(entry['size']).decode()
+
+    with tarfile.open(filename) as tar:
+        return tar.extractfile(name).read().decode()
+
+
+def extract_archive(filename,outdir,names=None):
+
+    # Write the files (all of them, or only names) to outdir, returns their paths
+    paths = []
+    for name,text in iter_archive(filename):
+        if names is not None and name not in names:
+            continue
+        check_name(name)
+        path = os.path.join(outdir,name)
+        os.makedirs(os.path.dirname(path) or '.',exist_ok=True)
+        with open(path,'w') as f:
+            f.write(text)
+        paths.append(path)
+
+    return paths
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='List or extract an AUTOSPEC archive')
+    parser.add_argument('archive',help='.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz or .zip archive')
+    parser.add_argument('--list',action='store_true',help='list the files and their sizes')
+    parser.add_argument('--extract',default=None,help='directory to extract the files to')
+    parser.add_argument('--names',nargs='+',default=None,help='only extract these files')
+    args = parser.parse_args(argv)
+
+    if args.list or args.extract is None:
+        for entry in read_index(args.archive)['files']:
+            print('%10d  %s' % (entry['size'],entry['name']))
+
+    if args.extract is not None:
+        paths = extract_archive(args.archive,args.extract,args.names)
+        print('Extracted %d files to %s' % (len(paths),args.extract))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to benchmark AUTOSPEC file creation on synthetic chem and LAYERS files:
+    python bench_AUTOSPEC.py [--layers N ...] [--species N ...] [--clouds N] [--models N]
+                             [--jobs N] [--json JSONFILE]
+
+Inputs:
+    --layers:  numbers of layers to test (optional, default 50 200 2000)
+    --species:  numbers of molecules to test (optional, default 5 16 300)
+    --clouds:  number of cloud altitudes per model (optional, default 20)
+    --models:  number of models per sweep (optional, default 10)
+    --jobs:  number of worker processes for the sweep (optional, default 1)
+    --json:  file to write all results to (optional)
+
+Outputs: for every combination of layers and species
+    files/s:  AUTOSPEC files written per second over the whole sweep
+    stage times:  total time of each stage (parse_layers, parse_chem, interpolate, format, render, write)
+    readers:  time of read_chem_files (one molecule) and read_LAYERS
+    peak memory:  peak Python memory of make_AUTOSPEC for one model (MB)
+
+The synthetic files can also be written on their own:
+    write_chem_file(filename,nspecies,nalt,seed)
+    write_layers_file(filename,nlay,seed)
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from timing_AUTOSPEC import TIMER
+
+
+def write_block(f,label,vals,per_row,last_caret):
+
+    # Data block: label, per_row values per line, ^ at the end of each continued line
+    rows = [vals[i:i+per_row] for i in range(0,len(vals),per_row)]
+    for k in range(len(rows)):
+        row = ' '.join(rows[k])
+        if k == 0:
+            row = label+'	'+row
+        else:
+            row = '	'+row
+        if k < len(rows)-1 or last_caret:
+            row = row+' ^'
+        f.write(row+'\n')
+    f.write('\n')
+
+
+def write_chem_file(filename,nspecies,nalt,seed=0):
+
+    # Chem file as written by CHEMCLIM, with molecules named M0, M1, ...
+    rng = np.random.default_rng(seed)
+    alt = np.linspace(0,100,nalt)
+    altstr = ['%.4E' % v for v in alt]
+
+    with open(filename,'w') as f:
+        f.write('Synthetic CHEMCLIM output\n\n')
+        for i in range(nspecies):
+            name = 'M'+str(i)
+            mr = 10**rng.uniform(-12,-2,nalt)
+            f.write('Molecule '+name+' '+str(i)+'\n\n')
+            write_block(f,name+' MR',['%.4E' % v for v in mr],5,True)
+            write_block(f,name+' ALT',altstr,5,True)
+
+
+def write_layers_file(filename,nlay,seed=0):
+
+    # LAYERS file, layers from the top of the atmosphere down
+    rng = np.random.default_rng(seed)
+    alt = np.linspace(80,0,nlay)
+    ealt = alt+0.5*(alt[0]-alt[-1])/nlay
+    temp = rng.uniform(180,300,nlay)
+
+    with open(filename,'w') as f:
+        f.write('Synthetic LAYERS file\n')
+        f.write('Very lowest layer '+str(nlay)+'\n\n')
+        write_block(f,'Altitudes (km)',['%.4f' % v for v in alt],4,False)
+        write_block(f,'Effective altitudes',['%.4f' % v for v in ealt],4,False)
+        write_block(f,'Temperatures (K)',['%.2f' % v for v in temp],4,False)
+
+
+def bench_AUTOSPEC(nlay,nspecies,nclouds,nmodels,workers=1,workdir=None):
+
+    # Code to run make_AUTOSPEC for many models
+    from sweep_AUTOSPEC import sweep_AUTOSPEC
+    from make_AUTOSPEC import make_AUTOSPEC
+    from read_chem_files import read_chem_files
+    from read_LAYERS import read_LAYERS
+
+    tmp = tempfile.mkdtemp(dir=workdir)
+    try:
+        jobs = []
+        mollist = ['M'+str(i) for i in range(nspecies)]
+        clist = np.linspace(1.0,60.0,nclouds).round(1).tolist()
+        for k in range(nmodels):
+            lfile = os.path.join(tmp,'LAYERS_'+str(k)+'.txt')
+            cfile = os.path.join(tmp,'chem_'+str(k))
+            write_layers_file(lfile,nlay,k)
+            write_chem_file(cfile,nspecies,max(nlay//2,10),k)
+            jobs.append({'layersfile': lfile,'chemfile': cfile,'temp': '5772.00',
+                         'clist': clist,'mollist': mollist})
+
+        # Readers on their own
+        t0 = time.perf_counter()
+        read_chem_files(jobs[0]['chemfile'],mollist[-1])
+        t_chem = time.perf_counter()-t0
+        t0 = time.perf_counter()
+        read_LAYERS(jobs[0]['layersfile'])
+        t_layers = time.perf_counter()-t0
+
+        # Whole sweep
+        TIMER.reset()
+        t0 = time.perf_counter()
+        with TIMER.recording():
+            failed = sweep_AUTOSPEC(jobs,workers)
+        wall = time.perf_counter()-t0
+        stages = TIMER.totals()
+        TIMER.reset()
+
+        # Peak memory of one model
+        tracemalloc.start()
+        job = jobs[0]
+        make_AUTOSPEC(job['layersfile'],job['chemfile'],job['mollist'],job['temp'],job['clist'])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(tmp)
+
+    nfiles = (nmodels-len(failed))*(2+nclouds)
+
+    return {'layers': nlay,'species': nspecies,'clouds': nclouds,'models': nmodels,
+            'workers': workers,'files': nfiles,'seconds': wall,'files_per_sec': nfiles/wall,
+            'read_chem_files': t_chem,'read_LAYERS': t_layers,
+            'stages': {stage: stages[stage]['seconds'] for stage in stages},
+            'peak_memory_mb': peak/1e6}
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmark AUTOSPEC file creation')
+    parser.add_argument('--layers',nargs='+',type=int,default=[50,200,2000])
+    parser.add_argument('--species',nargs='+',type=int,default=[5,16,300])
+    parser.add_argument('--clouds',type=int,default=20)
+    parser.add_argument('--models',type=int,default=10)
+    parser.add_argument('--jobs','-j',type=int,default=1)
+    parser.add_argument('--json',default=None)
+    args = parser.parse_args(argv)
+
+    stages = ['parse_layers','parse_chem','interpolate','format','render','write']
+    print('layers species   files/s  '+'  '.join(['%12s' % s for s in stages])
+          +'  read_chem  read_LAYERS  peak MB')
+
+    results = []
+    for nlay in args.layers:
+        for nspecies in args.species:
+            res = bench_AUTOSPEC(nlay,nspecies,args.clouds,args.models,args.jobs)
+            results.append(res)
+            print('%6d %7d %9.1f  ' % (nlay,nspecies,res['files_per_sec'])
+                  +'  '.join(['%12.4f' % res['stages'].get(s,0.0) for s in stages])
+                  +'  %9.4f  %11.4f  %7.1f' % (res['read_chem_files'],res['read_LAYERS'],
+                                              res['peak_memory_mb']))
+
+    if args.json is not None:
+        with open(args.json,'w') as f:
+            json.dump(results,f,indent=1)
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
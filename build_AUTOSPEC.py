@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to keep a build manifest of AUTOSPEC files, so only outdated files are created again:
+    build = BuildManifest(filename)
+    stale = build.stale_outputs(layersfile,chemfile,mollist,temp,clist,outdir,coarsen,prune)
+    build.record(path,key)
+    build.save()
+
+Inputs: build manifest file
+    filename:  path to the JSON build manifest as a string (created on the first save)
+    layersfile, chemfile, mollist, temp, clist, outdir, coarsen, prune:  as for make_AUTOSPEC
+
+Outputs:
+    stale_outputs:  dict of AUTOSPEC file -> key for every file that has to be created again
+    record:  marks an AUTOSPEC file as created from the inputs with that key
+
+The key of each AUTOSPEC file is a hash of everything it is made from: the contents of the
+LAYERS and chem files, the molecule list, the stellar temperature (reflectance), the cloud
+altitude (emission with clouds) and the generator VERSION. Coarsened files also depend on
+the tolerance and every cloud (whose layers aren't merged), and pruned files on the pruning
+rule. A file is outdated if its key
+changed, or if it is missing or was changed since it was created.
+
+The hash of each input file is kept with its size and modification time, so unchanged files
+are not read again.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from coarsen_layers import coarse_name
+from open_inputs import output_base
+from prune_species import prune_rule
+from render_AUTOSPEC import cloud_name, reflectance_name
+from timing_AUTOSPEC import logger
+
+
+# Version of the AUTOSPEC file layout, change it to create all files again
+VERSION = '1'
+
+
+def output_files(layersfile,clist,outdir=None,temp=None,coarsen=None):
+
+    # AUTOSPEC files of one model: (variant, stellar temperature or cloud, path)
+    # Files of a compressed LAYERS file are named without its compression extension,
+    # and coarsened files after the merged LAYERS file
+    layersfile = output_base(layersfile)
+    if coarsen is not None:
+        layersfile = coarse_name(layersfile,coarsen)
+    if outdir is not None:
+        layersfile = os.path.join(outdir,os.path.basename(layersfile))
+
+    # One reflectance file for each stellar temperature if there is a list of them
+    if isinstance(temp,(list,tuple)):
+        files = [('reflectance',t,layersfile+'_AUTOSPEC_'+reflectance_name(t)) for t in temp]
+    else:
+        files = [('reflectance',None,layersfile+'_AUTOSPEC_reflectance')]
+    files.append(('emission',None,layersfile+'_AUTOSPEC_emission'))
+    for calt in clist:
+        files.append(('emission_clouds',calt,layersfile+'_AUTOSPEC_'+cloud_name(calt)))
+
+    return files
+
+
+class BuildManifest:
+
+    def __init__(self,filename=None):
+
+        self.filename = filename
+        # Input file -> [size, modification time, content hash]
+        self.inputs = {}
+        # AUTOSPEC file -> [key, size, modification time]
+        self.outputs = {}
+
+        if filename is not None and os.path.exists(filename):
+            with open(filename) as f:
+                data = json.load(f)
+            if data.get('version') == VERSION:
+                self.inputs = data['inputs']
+                self.outputs = data['outputs']
+            else:
+                logger.info('Build manifest %s is from another version, creating all files',filename)
+
+
+    def file_hash(self,filename):
+
+        # Hash of the file contents, only read again if the file has changed
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        entry = self.inputs.get(path)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+
+        h = hashlib.sha1()
+        with open(path,'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20),b''):
+                h.update(chunk)
+        self.inputs[path] = [st.st_size,st.st_mtime_ns,h.hexdigest()]
+
+        return h.hexdigest()
+
+
+    def output_keys(self,layersfile,chemfile,mollist,temp,clist,outdir=None,coarsen=None,prune=None):
+
+        # Parsed files stand for the file they were parsed from
+        layersfile = getattr(layersfile,'filename',layersfile)
+        chemfile = getattr(chemfile,'filename',chemfile)
+
+        common = '|'.join([VERSION,self.file_hash(layersfile),self.file_hash(chemfile),' '.join(mollist)])
+        if coarsen is not None:
+            common = common+'|coarsen '+repr(float(coarsen))+' '+' '.join([cloud_name(calt) for calt in clist])
+        if prune is not None:
+            common = common+'|prune '+str(prune_rule(prune))
+
+        keys = {}
+        for variant,param,path in output_files(layersfile,clist,outdir,temp,coarsen):
+            # Only the reflectance file uses the stellar temperature
+            if variant == 'reflectance':
+                extra = str(temp if param is None else param)
+            elif variant == 'emission_clouds':
+                extra = str(param)
+            else:
+                extra = ''
+            keys[path] = hashlib.sha1((common+'|'+variant+'|'+extra).encode()).hexdigest()
+
+        return keys
+
+
+    def stale(self,path,key):
+
+        entry = self.outputs.get(os.path.abspath(path))
+        if entry is None or entry[0] != key:
+            return True
+
+        # The file is missing or was changed by something else
+        try:
+            st = os.stat(path)
+        except OSError:
+            return True
+        return entry[1] != st.st_size or entry[2] != st.st_mtime_ns
+
+
+    def stale_outputs(self,layersfile,chemfile,mollist,temp,clist,outdir=None,coarsen=None,prune=None):
+
+        keys = self.output_keys(layersfile,chemfile,mollist,temp,clist,outdir,coarsen,prune)
+
+        return {path: keys[path] for path in keys if self.stale(path,keys[path])}
+
+
+    def record(self,path,key):
+
+        st = os.stat(path)
+        self.outputs[os.path.abspath(path)] = [key,st.st_size,st.st_mtime_ns]
+
+
+    def subset(self,layersfile,chemfile,outputs):
+
+        # Small manifest with only the entries a single model needs (to send to workers)
+        sub = BuildManifest()
+        for filename in (layersfile,chemfile):
+            path = os.path.abspath(getattr(filename,'filename',filename))
+            if path in self.inputs:
+                sub.inputs[path] = self.inputs[path]
+        for path in outputs:
+            path = os.path.abspath(path)
+            if path in self.outputs:
+                sub.outputs[path] = self.outputs[path]
+
+        return sub
+
+
+    def merge(self,other):
+
+        self.inputs.update(other.inputs)
+        self.outputs.update(other.outputs)
+
+
+    def save(self):
+
+        # Write to a temporary file and rename, so the manifest is never half written
+        bdir = os.path.dirname(os.path.abspath(self.filename))
+        fd,tmp = tempfile.mkstemp(dir=bdir,suffix='.tmp')
+        with os.fdopen(fd,'w') as f:
+            json.dump({'version': VERSION,'inputs': self.inputs,'outputs': self.outputs},f)
+        os.replace(tmp,self.filename)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to keep parsed chem and LAYERS files in an on-disk cache so they are only parsed once:
+    cache = InputCache(cachedir,maxsize,content_hash)
+    chem = cache.chem(chemfile)
+    lay = cache.layers(layersfile)
+
+Inputs: cache directory, maximum cache size, content hash switch
+    cachedir:  path to the cache directory as a string (created if it doesn't exist)
+    maxsize:  maximum size of the cache in bytes (optional, default 1 GB)
+    content_hash:  if True, also key the cache by a hash of the file contents (optional)
+
+Outputs: a parsed ChemFile or LayersFile
+
+The parsed data is stored as a .npz sidecar in the cache directory, keyed by the path, size
+and modification time of the file (and its contents if content_hash is True). An entry is
+replaced as soon as its file changes, and the least recently used entries are removed when
+the cache grows beyond maxsize.
+"""
+
+import glob
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from read_chem_files import ChemFile
+from read_LAYERS import LayersFile
+
+
+# Version of the stored data, entries of other versions are parsed again
+FORMAT = 2
+
+
+class InputCache:
+
+    def __init__(self,cachedir,maxsize=1e9,content_hash=False):
+
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        self.content_hash = content_hash
+        os.makedirs(cachedir,exist_ok=True)
+
+
+    def key(self,kind,filename):
+
+        # Entries are named <path hash>-<file state hash>.npz, so an older entry for the
+        # same file can be found and removed
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+
+        state = hashlib.sha1((kind+'|'+str(st.st_size)+'|'+str(st.st_mtime_ns)+'|'+str(FORMAT)).encode())
+        if self.content_hash:
+            with open(path,'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20),b''):
+                    state.update(chunk)
+
+        return hashlib.sha1(path.encode()).hexdigest()[:16],state.hexdigest()[:16]
+
+
+    def load(self,kind,filename):
+
+        # Returns the stored arrays, or None if the file isn't cached (or has changed)
+        pkey,skey = self.key(kind,filename)
+        entry = os.path.join(self.cachedir,pkey+'-'+skey+'.npz')
+
+        try:
+            with np.load(entry,allow_pickle=False) as data:
+                data = {name: data[name] for name in data.files}
+        except (OSError,ValueError):
+            return None,(pkey,skey)
+
+        # Mark as recently used
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+        return data,(pkey,skey)
+
+
+    def store(self,keys,data):
+
+        pkey,skey = keys
+
+        # Remove entries for older versions of the same file
+        for old in glob.glob(os.path.join(self.cachedir,pkey+'-*.npz')):
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+        # Write to a temporary file and rename, so other processes never see half an entry
+        fd,tmp = tempfile.mkstemp(dir=self.cachedir,suffix='.tmp')
+        with os.fdopen(fd,'wb') as f:
+            np.savez(f,**data)
+        os.replace(tmp,os.path.join(self.cachedir,pkey+'-'+skey+'.npz'))
+
+        self.evict()
+
+
+    def evict(self):
+
+        # Remove the least recently used entries until the cache fits in maxsize
+        entries = []
+        for entry in glob.glob(os.path.join(self.cachedir,'*.npz')):
+            try:
+                st = os.stat(entry)
+            except OSError:
+                continue
+            entries.append((st.st_mtime,st.st_size,entry))
+
+        total = sum([size for mtime,size,entry in entries])
+        for mtime,size,entry in sorted(entries):
+            if total <= self.maxsize:
+                break
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+            total = total-size
+
+
+    def chem(self,chemfile):
+
+        data,keys = self.load('chem',chemfile)
+
+        if data is not None:
+            names = data['names']
+            species = {}
+            for i in range(len(names)):
+                species[str(names[i])] = (data['alt'+str(i)],data['mr'+str(i)])
+            return ChemFile(chemfile,species)
+
+        chem = ChemFile(chemfile)
+
+        data = {'names': np.array(chem.names(),dtype=str)}
+        i = 0
+        for name in chem.names():
+            data['alt'+str(i)],data['mr'+str(i)] = chem.lookup(name)
+            i = i+1
+        self.store(keys,data)
+
+        return chem
+
+
+    def layers(self,layersfile):
+
+        data,keys = self.load('layers',layersfile)
+
+        if data is not None:
+            labels = data['labels']
+            blocks = {}
+            for i in range(len(labels)):
+                blocks[str(labels[i])] = data['block'+str(i)]
+            return LayersFile(layersfile,blocks,int(data['n']))
+
+        lay = LayersFile(layersfile)
+
+        data = {'labels': np.array(list(lay.blocks),dtype=str),'n': np.array(lay.n)}
+        i = 0
+        for label in lay.blocks:
+            data['block'+str(i)] = lay.blocks[label]
+            i = i+1
+        self.store(keys,data)
+
+        return lay
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to check that every way of creating AUTOSPEC files still writes exactly the files of the
+original make_AUTOSPEC codes:
+    problems = check_AUTOSPEC()
+
+    python check_AUTOSPEC.py [--workdir DIR]
+
+Input:  directory for the synthetic files (optional, default is a temporary directory,
+        removed at the end)
+
+Output: list of problems, empty if every file is the same as the expected file
+        (the command line prints them and exits with 1 if there are any)
+
+The synthetic LAYERS and chem files of bench_AUTOSPEC.py (MODELS, with fixed seeds) are
+written again, and the reflectance, emission and emission_clouds files made from them by:
+    - make_AUTOSPEC (into an outdir that doesn't exist yet)
+    - make_AUTOSPEC_reflectance, make_AUTOSPEC_emission and make_AUTOSPEC_emission_clouds
+    - sweep_AUTOSPEC with two worker processes (into an outdir that doesn't exist yet)
+    - render_AUTOSPEC (in memory)
+are compared byte for byte with the files in expected_AUTOSPEC/, which were written by the
+original make_AUTOSPEC codes from the same inputs. make_AUTOSPEC_reflectance is also run with
+a temperature that isn't a string, which is written with str(temp).
+
+Two more checks don't have expected files:
+    - files made with coarsen (COARSEN, a model whose lowest layer is on its own) are named
+      after the merged LAYERS file written with them, and pass validate_AUTOSPEC against it,
+      e.g. the emission reference temperature is exactly that of the lowest layer
+    - a LAYERS file with the one-word label Altitudes has all its altitudes
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+
+from bench_AUTOSPEC import write_chem_file, write_layers_file
+from timing_AUTOSPEC import setup_logging
+
+
+# Expected files, written by the original make_AUTOSPEC codes
+EXPECTED = os.path.join(os.path.dirname(os.path.abspath(__file__)),'expected_AUTOSPEC')
+
+# (LAYERS file, number of layers, chem file, seed) of each model, with one value and a full
+# row of six on the last row of each block (the original codes need at least 13 layers)
+MODELS = [('LAYERS_0.txt',13,'chem_0',0),('LAYERS_1.txt',18,'chem_1',1)]
+
+# Molecules of the synthetic chem files (6 molecules, 9 altitudes), XX isn't in them
+MOLLIST = ['M0','M1','M2','M3','M4','M5','XX']
+TEMP = '5772.00'
+CLIST = [10.0,55.5]
+
+# Model and tolerance of the coarsened files
+COARSEN = ('LAYERS_c.txt',18,'chem_c',29)
+COARSEN_TOL = 100
+
+# Variants of every model (file suffix after _AUTOSPEC_)
+VARIANTS = ['reflectance','emission','emission_10.0km','emission_55.5km']
+
+
+def write_inputs(workdir):
+
+    for lfile,nlay,cfile,seed in MODELS:
+        write_layers_file(os.path.join(workdir,lfile),nlay,seed)
+        write_chem_file(os.path.join(workdir,cfile),6,9,seed)
+
+
+def compare(problems,what,filename,text):
+
+    # Compare a file (or its text) with the expected file of the same name
+    with open(os.path.join(EXPECTED,os.path.basename(filename))) as f:
+        expected = f.read()
+    if text is None:
+        if not os.path.isfile(filename):
+            problems.append(what+': '+filename+' not written')
+            return
+        with open(filename) as f:
+            text = f.read()
+    if text != expected:
+        problems.append(what+': '+os.path.basename(filename)+' differs from the expected file')
+
+
+def run(problems,what,func,*args):
+
+    # Run one code, an error is a problem (the other checks still run), False if it failed
+    try:
+        func(*args)
+    except Exception:
+        problems.append(what+' failed\n'+traceback.format_exc())
+        return False
+    return True
+
+
+def check_AUTOSPEC(workdir=None):
+
+    # Codes to check AUTOSPEC and LAYERS files
+    from coarsen_layers import coarse_name
+    from read_LAYERS import LayersFile
+    from validate_AUTOSPEC import validate_AUTOSPEC
+    # Codes that create AUTOSPEC files
+    from make_AUTOSPEC import make_AUTOSPEC
+    from make_AUTOSPEC_reflectance import make_AUTOSPEC_reflectance
+    from make_AUTOSPEC_emission import make_AUTOSPEC_emission
+    from make_AUTOSPEC_emission_clouds import make_AUTOSPEC_emission_clouds
+    from render_AUTOSPEC import render_AUTOSPEC
+    from sweep_AUTOSPEC import sweep_AUTOSPEC
+
+    tmp = tempfile.mkdtemp(dir=workdir)
+    problems = []
+    try:
+        write_inputs(tmp)
+
+        # make_AUTOSPEC creates the outdir
+        outdir = os.path.join(tmp,'make','new')
+        for lfile,nlay,cfile,seed in MODELS:
+            if not run(problems,'make_AUTOSPEC',make_AUTOSPEC,os.path.join(tmp,lfile),os.path.join(tmp,cfile),
+                       MOLLIST,TEMP,CLIST,outdir):
+                continue
+            for variant in VARIANTS:
+                compare(problems,'make_AUTOSPEC',os.path.join(outdir,lfile+'_AUTOSPEC_'+variant),None)
+
+        # Each code on its own, next to the LAYERS file
+        for lfile,nlay,cfile,seed in MODELS:
+            lpath,cpath = os.path.join(tmp,lfile),os.path.join(tmp,cfile)
+            run(problems,'make_AUTOSPEC_reflectance',make_AUTOSPEC_reflectance,lpath,cpath,MOLLIST,TEMP)
+            run(problems,'make_AUTOSPEC_emission',make_AUTOSPEC_emission,lpath,cpath,MOLLIST)
+            for calt in CLIST:
+                run(problems,'make_AUTOSPEC_emission_clouds',make_AUTOSPEC_emission_clouds,lpath,cpath,MOLLIST,calt)
+            for variant in VARIANTS:
+                code = 'make_AUTOSPEC_'+('emission_clouds' if variant.endswith('km') else variant)
+                compare(problems,code,lpath+'_AUTOSPEC_'+variant,None)
+
+            # A temperature that isn't a string
+            if not run(problems,'make_AUTOSPEC_reflectance with temperature '+str(float(TEMP)),
+                       make_AUTOSPEC_reflectance,lpath,cpath,MOLLIST,float(TEMP)):
+                continue
+            with open(os.path.join(EXPECTED,lfile+'_AUTOSPEC_reflectance')) as f:
+                expected = f.read().replace('\t'+TEMP+'\n','\t'+str(float(TEMP))+'\n',1)
+            with open(lpath+'_AUTOSPEC_reflectance') as f:
+                if f.read() != expected:
+                    problems.append('make_AUTOSPEC_reflectance: '+lfile+' with temperature '
+                                    +str(float(TEMP))+' differs from the expected file')
+
+        # Sweep with shared inputs in worker processes
+        outdir = os.path.join(tmp,'sweep','new')
+        jobs = [{'layersfile': os.path.join(tmp,lfile),'chemfile': os.path.join(tmp,cfile),'temp': TEMP,
+                 'clist': CLIST,'mollist': MOLLIST,'outdir': outdir} for lfile,nlay,cfile,seed in MODELS]
+        failed = []
+        run(problems,'sweep_AUTOSPEC',lambda: failed.extend(sweep_AUTOSPEC(jobs,2)))
+        for job,err in failed:
+            problems.append('sweep_AUTOSPEC: '+job['layersfile']+' failed\n'+err)
+        for lfile,nlay,cfile,seed in MODELS:
+            for variant in VARIANTS:
+                compare(problems,'sweep_AUTOSPEC',os.path.join(outdir,lfile+'_AUTOSPEC_'+variant),None)
+
+        # In memory
+        for lfile,nlay,cfile,seed in MODELS:
+            docs = {}
+            run(problems,'render_AUTOSPEC',lambda: docs.update(render_AUTOSPEC(os.path.join(tmp,lfile),
+                                                                                os.path.join(tmp,cfile),MOLLIST,TEMP,CLIST)))
+            for variant in VARIANTS:
+                compare(problems,'render_AUTOSPEC',lfile+'_AUTOSPEC_'+variant,docs.get(variant,''))
+
+        # Coarsened files are checked on their own
+        lfile,nlay,cfile,seed = COARSEN
+        lpath,cpath = os.path.join(tmp,lfile),os.path.join(tmp,cfile)
+        write_layers_file(lpath,nlay,seed)
+        write_chem_file(cpath,6,9,seed)
+        if run(problems,'make_AUTOSPEC with coarsen',make_AUTOSPEC,lpath,cpath,MOLLIST,TEMP,CLIST,None,
+               None,None,None,COARSEN_TOL):
+            # The files of the original layers aren't replaced
+            cpath = coarse_name(lpath,COARSEN_TOL)
+            for filename in [cpath]+[lpath+'_AUTOSPEC_'+variant for variant in VARIANTS]:
+                if os.path.isfile(filename) != (filename == cpath):
+                    problems.append('make_AUTOSPEC with coarsen: '+os.path.basename(filename)
+                                    +(' not written' if filename == cpath else ' written'))
+            report = validate_AUTOSPEC([cpath+'_AUTOSPEC_'+variant for variant in VARIANTS])
+            for filename in report:
+                problems.append('make_AUTOSPEC with coarsen: '+os.path.basename(filename)+': '
+                                +'; '.join(report[filename]))
+
+        # One-word block label
+        lpath = os.path.join(tmp,MODELS[0][0])
+        with open(lpath) as f:
+            text = f.read().replace('Altitudes (km)','Altitudes')
+        with open(lpath,'w') as f:
+            f.write(text)
+        lay = LayersFile(lpath)
+        if len(lay.alt) != MODELS[0][1]:
+            problems.append('LayersFile: %d altitudes with the label Altitudes, not %d' % (len(lay.alt),MODELS[0][1]))
+    finally:
+        shutil.rmtree(tmp)
+
+    return problems
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Check AUTOSPEC files against the expected files')
+    parser.add_argument('--workdir',default=None,help='directory for the synthetic files')
+    args = parser.parse_args(argv)
+
+    setup_logging(True,False)
+    problems = check_AUTOSPEC(args.workdir)
+    for problem in problems:
+        print(problem)
+    print('%d problems' % len(problems))
+
+    return 1 if len(problems) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
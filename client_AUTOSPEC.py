@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to request AUTOSPEC files from a running AUTOSPEC service (serve_AUTOSPEC.py):
+    with AUTOSPECClient(path) as client:
+        paths = client.generate(layersfile,chemfile,mollist,temp,clist)
+
+    python client_AUTOSPEC.py SOCKET LAYERS CHEM MOLECULES TEMP [--clouds CALT [CALT ...]] [--outdir DIR]
+
+Inputs:
+    path:  Unix socket of the service
+    command:  instead of path, command starting a service with --stdio, which is run as a
+              subprocess and closed with the client (e.g. ['python','serve_AUTOSPEC.py','--stdio'])
+    layersfile, chemfile, mollist, temp, clist, outdir, coarsen, prune:  as for make_AUTOSPEC
+    write:  True to write the files and return their paths (default), False to return a dict
+            of variant -> text instead
+
+Outputs: paths of the AUTOSPEC files written by the service, or their text
+
+AUTOSPECClient only imports the standard library, so starting the client is quick (the
+command line also reads cloud decks TOP:BOTTOM[:OPACITY] with parse_cloud). Paths are sent to
+the service as absolute paths. Failed requests raise RuntimeError with the service's error.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+
+
+class AUTOSPECClient:
+
+    def __init__(self,path=None,command=None):
+
+        if (path is None) == (command is None):
+            raise ValueError('Give either the socket path or the service command')
+
+        self.proc = None
+        self.sock = None
+        self.ids = 0
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+            self.sock.connect(path)
+            self.fin = self.sock.makefile('r')
+            self.fout = self.sock.makefile('w')
+        else:
+            self.proc = subprocess.Popen(command,stdin=subprocess.PIPE,stdout=subprocess.PIPE,text=True)
+            self.fin = self.proc.stdout
+            self.fout = self.proc.stdin
+
+
+    def request(self,**req):
+
+        # Send one request and wait for its response
+        self.ids += 1
+        req.setdefault('id',self.ids)
+        self.fout.write(json.dumps(req)+'\n')
+        self.fout.flush()
+
+        line = self.fin.readline()
+        if len(line) == 0:
+            raise RuntimeError('AUTOSPEC service closed the connection')
+        resp = json.loads(line)
+        if not resp['ok']:
+            raise RuntimeError(resp['error'])
+
+        return resp
+
+
+    def generate(self,layersfile,chemfile,mollist,temp,clist=(),outdir=None,write=True,coarsen=None,
+                 prune=None):
+
+        # The service may run in another directory
+        if outdir is not None:
+            outdir = os.path.abspath(outdir)
+        # Decks (tuples) are sent as JSON lists
+        clist = list(clist)
+        resp = self.request(op='generate',layersfile=os.path.abspath(layersfile),
+                            chemfile=os.path.abspath(chemfile),mollist=list(mollist),
+                            temp=temp,clist=clist,outdir=outdir,write=write,coarsen=coarsen,
+                            prune=None if prune is None else str(prune))
+
+        if write:
+            return resp['paths']
+        return resp['files']
+
+
+    def stats(self):
+
+        return self.request(op='stats')
+
+
+    def shutdown(self):
+
+        return self.request(op='shutdown')
+
+
+    def close(self):
+
+        if self.sock is not None:
+            self.fin.close()
+            self.fout.close()
+            self.sock.close()
+            self.sock = None
+        if self.proc is not None:
+            # The service stops at the end of its input
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc.stdout.close()
+            self.proc = None
+
+
+    def __enter__(self):
+
+        return self
+
+
+    def __exit__(self,*args):
+
+        self.close()
+
+
+def main(argv=None):
+
+    # Code to read cloud decks
+    from render_AUTOSPEC import parse_cloud
+
+    parser = argparse.ArgumentParser(description='Request AUTOSPEC files from a running AUTOSPEC service')
+    parser.add_argument('socket',help='Unix socket of the service')
+    parser.add_argument('layers',help='LAYERS file')
+    parser.add_argument('chem',help='chem file')
+    parser.add_argument('molecules',help='file with the molecule list')
+    parser.add_argument('temp',nargs='+',help='stellar temperature(s) for the reflectance file(s)')
+    parser.add_argument('--clouds',nargs='+',type=parse_cloud,default=[],
+                        help='cloud altitudes (km) or decks TOP:BOTTOM[:OPACITY]')
+    parser.add_argument('--outdir',default=None,help='directory for the AUTOSPEC files')
+    args = parser.parse_args(argv)
+
+    # Same format as for run_AUTOSPEC.py (names separated by spaces or new lines, # comments)
+    mollist = []
+    with open(args.molecules) as f:
+        for row in f:
+            mollist.extend(row.split('#')[0].split())
+    temp = args.temp[0] if len(args.temp) == 1 else args.temp
+
+    with AUTOSPECClient(args.socket) as client:
+        for path in client.generate(args.layers,args.chem,mollist,temp,args.clouds,args.outdir):
+            print(path)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
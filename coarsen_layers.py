@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to merge adjacent layers of a LAYERS file that the chemistry doesn't resolve, so the
+AUTOSPEC files have fewer layers:
+    lay,chem,groups = coarsen_layers(layersfile,chemfile,mollist,tol,clist)
+    path = coarse_name(layersfile,tol,outdir)
+
+Inputs: LAYERS file, chem file, molecule list, tolerance, cloud list
+    layersfile:  path to LAYERS file as a string (or a parsed LayersFile)
+    chemfile:  path to chem file as a string (or a parsed ChemFile)
+    mollist: list of molecules (all as strings written exactly as in the chem file)
+    tol:  largest relative difference between the mixing ratios (and temperature) of a layer
+          and those of the merged layer it goes into, e.g. 0.05
+    clist:  cloud altitudes and decks as for make_AUTOSPEC (optional), their layers are kept
+    outdir:  directory of the AUTOSPEC files (optional, default is next to the LAYERS file)
+
+Outputs:
+    Element 0:  LayersFile with the merged layers, named by coarse_name (lay.text() is the
+                text of the merged LAYERS file)
+    Element 1:  ChemFile with the mixing ratios of the merged layers at their effective
+                altitudes, so AUTOSPECRenderer(lay,chem,mollist) writes them unchanged
+    Element 2:  list of arrays of the original layer indices in each merged layer
+    coarse_name:  path of the merged LAYERS file
+
+The mixing ratios are first interpolated onto the original layers. Going down from the top,
+each layer is added to the current merged layer as long as every molecule and the temperature
+of every layer in it stay within tol of the merged values. Merged values are column-weighted
+means (the weight of a layer is its thickness times pressure over temperature, or only its
+thickness without a Pressures block), so the column of every molecule is kept. Altitudes and
+pressures (layer bottoms) are those of the lowest layer merged.
+
+The top and bottom layers (where reflectance and emission put the CONT value, and the
+emission reference temperature) and the layers of every cloud (both ends of decks) are never
+merged, so each cloud is still found in the same place.
+
+make_AUTOSPEC writes the merged LAYERS file with the AUTOSPEC files, as the original LAYERS
+file name with suffix _coarse# (the tolerance), e.g. LAYERS.txt_coarse0.05, and names the
+AUTOSPEC files after it, so they never replace the files of the original layers and are
+checked against the layers they were made from (see validate_AUTOSPEC.py).
+"""
+
+import os
+
+import numpy as np
+
+from interp_chem import interp_chem
+from open_inputs import output_base
+from read_chem_files import ChemFile, load_chem_file
+from read_LAYERS import LayersFile, load_layers_file
+from timing_AUTOSPEC import TIMER, logger
+
+
+# Blocks with the value at the bottom of each layer rather than across it
+BOTTOM_BLOCKS = ('Altitudes','Pressures')
+
+
+def coarse_name(layersfile,tol,outdir=None):
+
+    # Merged LAYERS file, next to the LAYERS file (or in outdir), without its compression extension
+    name = output_base(layersfile)+'_coarse'+repr(float(tol))
+    if outdir is not None:
+        name = os.path.join(outdir,os.path.basename(name))
+    return name
+
+
+def column_weights(lay):
+
+    # Column of each layer, up to a constant: thickness times number density (P/T)
+    n = len(lay.ealt)
+    bounds = lay.alt if len(lay.alt) == n else lay.ealt
+    dz = np.abs(np.diff(bounds))
+    # The top layer is as thick as the one below it
+    dz = np.concatenate([dz[:1],dz]) if n > 1 else np.ones(n)
+
+    pres = lay.find('Pressures')
+    if len(pres) == n and len(lay.temp) == n:
+        return dz*pres/lay.temp
+    return dz
+
+
+def kept_layers(lay,clist):
+
+    # Layers that stay on their own: top, bottom and every cloud (first of equally close
+    # layers, as in AUTOSPECRenderer.cloud_layers)
+    n = len(lay.ealt)
+    keep = set([0,n-1])
+    for cloud in clist:
+        # Altitude of a thin cloud, or top and bottom of a deck
+        for calt in np.atleast_1d(cloud)[:2]:
+            keep.add(int(np.argmin(np.abs(lay.ealt-calt))))
+
+    return keep
+
+
+def merge_groups(vals,w,tol,keep):
+
+    # Groups of adjacent layers (columns of vals) whose values are all within tol of the
+    # column-weighted mean of their group
+    n = vals.shape[1]
+    groups = []
+    start = 0
+    # Running weighted sum, largest and smallest values of the current group
+    total,wsum = vals[:,0]*w[0],w[0]
+    hi,lo = vals[:,0].copy(),vals[:,0].copy()
+
+    for i in range(1,n):
+        ok = i not in keep and start not in keep
+        if ok:
+            total1 = total+vals[:,i]*w[i]
+            wsum1 = wsum+w[i]
+            hi1 = np.maximum(hi,vals[:,i])
+            lo1 = np.minimum(lo,vals[:,i])
+            mean = total1/wsum1
+            ok = np.all(hi1-mean <= tol*mean) and np.all(mean-lo1 <= tol*mean)
+        if ok:
+            total,wsum,hi,lo = total1,wsum1,hi1,lo1
+            continue
+        groups.append(np.arange(start,i))
+        start = i
+        total,wsum = vals[:,i]*w[i],w[i]
+        hi,lo = vals[:,i].copy(),vals[:,i].copy()
+
+    groups.append(np.arange(start,n))
+
+    return groups
+
+
+def coarsen_layers(layersfile,chemfile,mollist,tol,clist=()):
+
+    lay = load_layers_file(layersfile)
+    chem = load_chem_file(chemfile)
+    n = len(lay.ealt)
+
+    with TIMER.stage('coarsen',lay.filename,layers=n):
+        names,mrs = interp_chem(chem,mollist,lay.ealt)
+        w = column_weights(lay)
+
+        # Merge on the mixing ratios and the temperature together
+        vals = np.vstack([mrs,lay.temp[None,:]]) if len(lay.temp) == n else mrs
+        groups = merge_groups(vals,w,tol,kept_layers(lay,clist))
+
+        # Column-weighted mean of each group (sum over the layers of the group), layers
+        # on their own are copied so their values (e.g. the emission temperature) are exact
+        starts = np.array([g[0] for g in groups])
+        bottoms = np.array([g[-1] for g in groups])
+        single = starts == bottoms
+        wg = np.add.reduceat(w,starts)
+        def merge(v):
+            merged = np.add.reduceat(v*w,starts,axis=-1)/wg
+            merged[...,single] = v[...,starts[single]]
+            return merged
+
+        blocks = {}
+        for label,v in lay.blocks.items():
+            if len(v) != n:
+                blocks[label] = v
+            elif label.startswith(BOTTOM_BLOCKS):
+                blocks[label] = v[bottoms]
+            else:
+                blocks[label] = merge(v)
+        coarse = LayersFile(coarse_name(lay.filename,tol),blocks,len(groups))
+
+        # Mixing ratios at the merged effective altitudes (increasing, for interpolation)
+        ealt = coarse.ealt
+        if len(np.unique(ealt)) != len(ealt):
+            raise ValueError('Merged layers of '+str(lay.filename)+' have the same effective altitude')
+        order = np.argsort(ealt)
+        cmrs = merge(mrs) if len(names) else mrs
+        species = {names[k]: (ealt[order],cmrs[k][order]) for k in range(len(names))}
+        coarse_chem = ChemFile(chem.filename,species)
+
+    logger.info('Coarsened %s from %d to %d layers (%d removed, tolerance %g)',
+                lay.filename,n,len(groups),n-len(groups),tol)
+
+    return coarse,coarse_chem,groups
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to convert mixing ratios to the fortran format (X.XXE+YY) and row layout of AUTOSPEC files:
+    format_AUTOSPEC(vals)
+
+Input: mixing ratios
+    vals:  array of values, either one molecule (layers) or a 2-D array (molecules x layers)
+
+Output: list of strings (or list of lists of strings for a 2-D array)
+
+Row layout of a molecule (or CONT) block:
+    format_block(name,flag,vals):  text of the block for one molecule
+    format_blocks(names,flags,vals):  list of block texts for a 2-D array of mixing ratios
+    join_block(name,flag,rows):  text of a block from rows already laid out
+"""
+
+import numpy as np
+
+
+# Smallest normal number, values below it are denormals
+TINY = np.finfo(float).tiny
+
+
+def fortran_format(val):
+
+    # Scientific notation, two decimal places, two exponent digits
+    val = np.format_float_scientific(val,precision=2,pad_left=True,exp_digits=2)
+
+    # Convert to string and break up into number and exponent
+    vs = str(val).split('e')
+
+    # Number part
+    v1 = vs[0]
+    # If the length of the number isn't 4, add zeros onto end
+    if len(v1) == 2:
+        v1 = v1 + '00'
+    if len(v1) == 3:
+        v1 = v1 + '0'
+
+    return v1+'E'+vs[1]
+
+
+def format_AUTOSPEC(vals):
+
+    vals = np.asarray(vals,dtype=float)
+    flat = vals.ravel()
+
+    if not np.all(np.isfinite(flat)):
+        raise ValueError('Mixing ratios must be finite to be written to AUTOSPEC')
+
+    # All values are converted in one call
+    strs = (('%.2E '*len(flat)) % tuple(flat.tolist())).split()
+
+    # np.format_float_scientific keeps fewer digits for negative numbers (padding counts
+    # the sign) and for denormals, so these few values use the original conversion
+    bad = np.flatnonzero(np.signbit(flat) | ((flat != 0) & (np.abs(flat) < TINY)))
+    for k in bad:
+        strs[k] = fortran_format(flat[k])
+
+    if vals.ndim == 2:
+        n = vals.shape[1]
+        return [strs[i*n:(i+1)*n] for i in range(vals.shape[0])]
+
+    return strs
+
+
+def format_row(vals,last):
+
+    # Rows end with ^, the last row has a space after every value instead
+    if last:
+        return ' '.join(vals)+' \n'
+    return ' '.join(vals)+' ^\n'
+
+
+def format_rows(vals):
+
+    # File structure
+    #Molecule   1(0)  #1 #2 #3 #4 #5 #6 ^
+    #	 #7 #8 #9 #10 #11 #12 ^
+    # (until the numbers of layers is reached)
+
+    # Returns the rows of 6 values without the row prefix
+    rows = []
+    for n in range(0,len(vals),6):
+        rows.append(format_row(vals[n:n+6],n+6 >= len(vals)))
+
+    return rows
+
+
+def join_block(name,flag,rows):
+
+    # Put the molecule name and flag in front of the first row
+    return name+'   '+flag+'  '+'	 '.join(rows)
+
+
+def block_template(nlay):
+
+    # Layout of a block of nlay values
+    return join_block('%s','%s',format_rows(['%s']*nlay))
+
+
+def format_block(name,flag,vals):
+
+    # vals can be strings already in fortran format or numbers
+    if len(vals) != 0 and not isinstance(vals[0],str):
+        vals = format_AUTOSPEC(vals)
+
+    return block_template(len(vals)) % tuple([name,flag]+list(vals))
+
+
+def format_blocks(names,flags,vals):
+
+    # One block of text for each row of a 2-D array (molecules x layers)
+    strs = format_AUTOSPEC(vals)
+    if len(strs) == 0:
+        return []
+
+    template = block_template(len(strs[0]))
+
+    return [template % tuple([names[i],flags[i]]+strs[i]) for i in range(len(strs))]
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to interpolate the mixing ratios of many molecules onto the LAYERS effective altitudes at once:
+    interp_chem(chemfile,mollist,ealt)
+
+Inputs: chem file, molecule list, effective altitudes
+    chemfile:  path to chem file as a string (or a parsed ChemFile)
+    mollist: list of molecules (all as strings written exactly as in the chem file)
+    ealt:  array of effective altitudes (km) from the LAYERS file
+    log:  if True, interpolate the logarithm of the mixing ratios (optional)
+    weights:  dict of InterpWeights to reuse between calls (optional)
+
+Outputs:
+    Element 0: list of the molecules found in the chem file
+    Element 1: array of mixing ratios (molecules x layers)
+
+Without the log option the mixing ratios are identical to np.interp(ealt,alt,mr).
+"""
+
+import numpy as np
+
+from read_chem_files import load_chem_file
+
+
+class InterpWeights:
+
+    # Interpolation from the chem file altitude grid (alt) to the effective altitudes
+    # (ealt), computed once and applied to any number of molecules on that grid
+
+    def __init__(self,alt,ealt):
+
+        alt = np.asarray(alt,dtype=float)
+        ealt = np.asarray(ealt,dtype=float)
+        n = len(alt)
+
+        # Index of the grid point below each effective altitude
+        j = np.searchsorted(alt,ealt,side='right')-1
+
+        # Below or above the grid the first or last mixing ratio is used
+        self.left = j < 0
+        self.right = j >= n-1
+        self.j = np.clip(j,0,max(n-2,0))
+
+        if n > 1:
+            # Repeated altitudes only give dx = 0 outside the grid, where the first or last
+            # mixing ratio is used, so 1 there only avoids dividing by zero
+            dx = alt[self.j+1]-alt[self.j]
+            self.dx = np.where(dx == 0,1.0,dx)
+            self.t = ealt-alt[self.j]
+            # Exactly on a grid point
+            self.exact = self.t == 0
+            # Strictly between two grid points
+            self.inside = ~(self.left | self.right | self.exact)
+        else:
+            self.right = np.ones(len(ealt),dtype=bool)
+
+
+    def apply(self,mr,log=False):
+
+        # mr is one molecule (altitudes) or many (molecules x altitudes)
+        mr = np.asarray(mr,dtype=float)
+
+        res = np.empty(mr.shape[:-1]+self.j.shape)
+        if mr.shape[-1] > 1:
+            lo = mr[...,self.j]
+            hi = mr[...,self.j+1]
+
+            # Same arithmetic as np.interp
+            res = (hi-lo)/self.dx*self.t+lo
+            res = np.where(self.exact,lo,res)
+
+            if log:
+                # Only between two positive mixing ratios
+                ok = (lo > 0) & (hi > 0) & self.inside
+                llo = np.log(np.where(ok,lo,1.0))
+                lhi = np.log(np.where(ok,hi,1.0))
+                res = np.where(ok,np.exp((lhi-llo)/self.dx*self.t+llo),res)
+
+        res = np.where(self.left,mr[...,:1],res)
+        res = np.where(self.right,mr[...,-1:],res)
+
+        return res
+
+
+def interp_chem(chemfile,mollist,ealt,log=False,weights=None):
+
+    chem = load_chem_file(chemfile)
+    ealt = np.asarray(ealt,dtype=float)
+
+    # Weights are kept per altitude grid, and can be shared between calls
+    if weights is None:
+        weights = {}
+
+    names = [mol for mol in mollist if mol in chem]
+
+    # Group molecules that share an altitude grid
+    groups = {}
+    for k in range(len(names)):
+        alt,mr = chem.lookup(names[k])
+        key = (alt.tobytes(),ealt.tobytes())
+        if key not in groups:
+            groups[key] = (alt,[])
+        groups[key][1].append(k)
+
+    mrs = np.empty((len(names),len(ealt)))
+    for key in groups:
+        alt,ks = groups[key]
+        if key not in weights:
+            weights[key] = InterpWeights(alt,ealt)
+
+        # All molecules on this grid in one matrix operation
+        mr = np.array([chem.lookup(names[k])[1] for k in ks])
+        mrs[ks] = weights[key].apply(mr,log)
+
+    return names,mrs
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to keep a journal of the jobs of a sweep, so a sweep that stops part way (killed,
+pre-empted, out of quota) carries on where it stopped when it is run again:
+    journal = SweepJournal(filename)
+    jobs = journal.remaining(jobs,retry_failed)
+    journal.record(job,err)
+    journal.close()
+
+Inputs:
+    filename:  path to the journal as a string (created if it doesn't exist)
+    jobs:  list of jobs as for sweep_AUTOSPEC
+    retry_failed:  if True (default), jobs that failed are run again, otherwise only the
+                   jobs that were never finished are
+    err:  error message of a failed job, None if it was done
+
+Outputs:
+    remaining:  the jobs that aren't done yet
+    record:  adds one line for the job to the journal
+
+The journal has one JSON line per finished job (key, status done or failed, LAYERS and chem
+file, time and error). Each line is written in one call and flushed to disk before the next
+job is recorded, so a job is either in the journal or not. A line cut off when the sweep was
+killed is ignored. The key of a job is a hash of everything its files are made from, so a
+changed job (e.g. another cloud list) is run again.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from prune_species import prune_rule
+from render_AUTOSPEC import cloud_name
+from timing_AUTOSPEC import logger
+
+
+def job_key(job):
+
+    # Everything that changes the files of a job
+    outdir = job.get('outdir')
+    fields = [os.path.abspath(job['layersfile']),os.path.abspath(job['chemfile']),list(job['mollist']),
+              job['temp'],[cloud_name(calt) for calt in job['clist']],
+              None if outdir is None else os.path.abspath(outdir),job.get('coarsen'),
+              None if job.get('prune') is None else str(prune_rule(job['prune']))]
+
+    return hashlib.sha1(json.dumps(fields).encode()).hexdigest()
+
+
+class SweepJournal:
+
+    def __init__(self,filename):
+
+        self.filename = filename
+        # Keys of the jobs done, and key -> error of the jobs that failed (last entry wins)
+        self.done = set()
+        self.failed = {}
+
+        ended = True
+        if os.path.exists(filename):
+            with open(filename) as f:
+                for line in f:
+                    ended = line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        logger.warning('Ignoring an unfinished line in journal %s',filename)
+                        continue
+                    if entry['status'] == 'done':
+                        self.done.add(entry['key'])
+                        self.failed.pop(entry['key'],None)
+                    else:
+                        self.done.discard(entry['key'])
+                        self.failed[entry['key']] = entry.get('error')
+
+        self.f = open(filename,'a')
+        # Start after a line cut off by a killed sweep
+        if not ended:
+            self.f.write('\n')
+
+
+    def remaining(self,jobs,retry_failed=True):
+
+        todo = []
+        for job in jobs:
+            key = job_key(job)
+            if key in self.done or (not retry_failed and key in self.failed):
+                continue
+            todo.append(job)
+
+        if len(todo) != len(jobs):
+            logger.info('%d of %d jobs already finished in journal %s',len(jobs)-len(todo),len(jobs),self.filename)
+
+        return todo
+
+
+    def record(self,job,err=None):
+
+        key = job_key(job)
+        entry = {'key': key,'status': 'done' if err is None else 'failed',
+                 'layersfile': job['layersfile'],'chemfile': job['chemfile'],'time': time.time()}
+        if err is not None:
+            entry['error'] = err
+            self.failed[key] = err
+        else:
+            self.done.add(key)
+            self.failed.pop(key,None)
+
+        # One line in one call, on disk before the next job
+        self.f.write(json.dumps(entry)+'\n')
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+
+    def close(self):
+
+        if not self.f.closed:
+            self.f.close()
+
+
+    def __enter__(self):
+
+        return self
+
+
+    def __exit__(self,*args):
+
+        self.close()
@@ -2,41 +2,108 @@
 # -*- coding: utf-8 -*-
 """
 Code to create both reflectance and emission AUTOSPEC files:
-    make_AUTOSPEC(layersfile,chemfile,mollist,temp)
+    make_AUTOSPEC(layersfile,chemfile,mollist,temp,clist)
 
 Inputs: LAYERS file, chem file, molecule list, stellar host temperature
-    layersfile:  path to LAYERS file as a string
-    chemfile:  path to chem file as a string
+    layersfile:  path to LAYERS file as a string (or a parsed LayersFile)
+    chemfile:  path to chem file as a string (or a parsed ChemFile)
     mollist: list of molecules (all as strings written exactly as in the chem file)
-    temp: stellar host temperature as a string with two decimal places
-    clist: list of cloud altitudes as floats
+    temp: stellar host temperature as a string with two decimal places (or a list of them)
+    clist: list (or array) of cloud altitudes as floats, or cloud decks (CloudDeck, a list or
+           tuple (top, bottom[, opacity]) or text 'TOP:BOTTOM[:OPACITY]', see render_AUTOSPEC.py)
+    outdir: directory for the AUTOSPEC files (optional, default is next to the LAYERS file)
+    cache: InputCache to keep the parsed LAYERS and chem files in (optional)
+    build: build manifest (path or BuildManifest) to only create outdated files (optional)
+    sink: where to send the files, e.g. MemorySink() to keep them in memory (optional, default
+          is DirectorySink() to write them, see sinks_AUTOSPEC.py)
+    coarsen: tolerance to merge adjacent layers with, e.g. 0.05 (optional, default keeps every
+             layer, see coarsen_layers.py)
+    prune: threshold to drop negligible molecules with, e.g. 1e-12 or 'column:1e-12' (optional,
+           see prune_species.py), a report of the molecules dropped is written with the files
     
 Outputs: reflectance and emission AUTOSPEC files
     Reflectance file:  original LAYERS file name with suffix _AUTOSPEC_reflectance
+                       (_AUTOSPEC_reflectance_#K for each temperature of a list)
     Emission file:  original LAYERS file name with suffix _AUTOSPEC_emission
     Emission files with clouds: like emission, but with _#km suffix with cloud altitude
+                                (_#-#km for decks, see render_AUTOSPEC.py)
+    Pruning report:  original LAYERS file name with suffix _pruned.json (only with prune)
+    With coarsen, the merged LAYERS file is written too, as the original LAYERS file name with
+    suffix _coarse# (the tolerance), and all the files above are named after it instead, e.g.
+    LAYERS.txt_coarse0.05_AUTOSPEC_emission
+
+To get the files as text, bytes or AUTOSPECDocument objects without writing them, see
+render_AUTOSPEC in render_AUTOSPEC.py.
 """
 
-def make_AUTOSPEC(layersfile,chemfile,mollist,temp,clist):
-    
-    # Code to create reflectance files
-    from make_AUTOSPEC_reflectance import make_AUTOSPEC_reflectance
-    # Code to create emission files
-    from make_AUTOSPEC_emission import make_AUTOSPEC_emission
-    # Code to create emission files with cloud layers
-    from make_AUTOSPEC_emission_clouds import make_AUTOSPEC_emission_clouds
-    
-    # Create reflectance file
-    make_AUTOSPEC_reflectance(layersfile,chemfile,mollist,temp)
-    
-    # Create emission file
-    make_AUTOSPEC_emission(layersfile,chemfile,mollist)
-    
-    # Create emission files with clouds
-    if len(clist) != 0:
-        # Run the program for each cloud altitude
-        for i in range(len(clist)):   
-            make_AUTOSPEC_emission_clouds(layersfile,chemfile,mollist,clist[i])
+def make_AUTOSPEC(layersfile,chemfile,mollist,temp,clist,outdir=None,cache=None,build=None,sink=None,coarsen=None,
+                  prune=None):
+    
+    # Code that renders AUTOSPEC files from shared molecule blocks
+    from render_AUTOSPEC import AUTOSPECRenderer, as_clouds, render_files
+    # Code to write the AUTOSPEC files (or keep them in memory)
+    from sinks_AUTOSPEC import DirectorySink
+    # Codes to parse LAYERS and chem files
+    from read_LAYERS import load_layers_file
+    from read_chem_files import load_chem_file
+    # Code to skip AUTOSPEC files that are up to date
+    from build_AUTOSPEC import BuildManifest, output_files
+    # Code to merge layers the chemistry doesn't resolve
+    from coarsen_layers import coarse_name, coarsen_layers
+    # Code to drop negligible molecules
+    from prune_species import prune_report, prune_rule, report_path
+    from timing_AUTOSPEC import logger
+    
+    clist = as_clouds(clist)
+    files = output_files(getattr(layersfile,'filename',layersfile),clist,outdir,temp,coarsen)
+    
+    # Only create the files whose inputs changed since the last build
+    save = isinstance(build,str)
+    if save:
+        build = BuildManifest(build)
+    if build is not None:
+        stale = build.stale_outputs(layersfile,chemfile,mollist,temp,clist,outdir,coarsen,prune)
+        files = [file for file in files if file[2] in stale]
+        if len(files) == 0:
+            logger.info('AUTOSPEC files of %s are up to date',getattr(layersfile,'filename',layersfile))
+            return
+    
+    # Parsed files can come from the cache
+    if cache is not None:
+        layersfile = load_layers_file(layersfile,cache)
+        chemfile = load_chem_file(chemfile,cache)
+    
+    # The default sink creates outdir if it doesn't exist yet
+    if sink is None:
+        sink = DirectorySink(outdir)
+    
+    # Merge adjacent layers within the tolerance (the cloud layers are kept), the merged
+    # LAYERS file goes with the AUTOSPEC files made from it
+    if coarsen is not None:
+        path = coarse_name(getattr(layersfile,'filename',layersfile),coarsen,outdir)
+        layersfile,chemfile,groups = coarsen_layers(layersfile,chemfile,mollist,coarsen,clist)
+        sink.write(path,layersfile.text())
+    
+    # Parse the LAYERS and chem files, interpolate and format all molecules once
+    # and share them between all files
+    prune = prune_rule(prune)
+    render = AUTOSPECRenderer(layersfile,chemfile,mollist,prune=prune)
+    
+    # Create reflectance and emission files (one reflectance file for each temperature
+    # of a list, and one emission file for each cloud)
+    for path,text in render_files(render,files,temp):
+        
+        # Only files written to their default path are kept in the build manifest
+        written = sink.write(path,text)
+        if build is not None and written == path:
+            build.record(path,stale[path])
+    
+    # Report of the molecules dropped
+    if prune is not None:
+        sink.write(report_path(render.lay.filename,outdir),prune_report(render,mollist,prune))
+    
+    if save:
+        build.save()
     
     
     
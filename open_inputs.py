@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to open chem and LAYERS files that may be compressed with gzip, xz or bzip2:
+    f = open_input(filename,mode)
+
+Inputs:
+    filename:  path to the file as a string
+    mode:  'rt' for text (default) or 'rb' for bytes
+
+Output: file object that decompresses the file as it's read
+
+Compressed files are found by their first bytes, not their names, so the readers take
+compressed and plain files alike without decompressing them to scratch first. The AUTOSPEC
+files of a compressed LAYERS file are named without the .gz, .xz or .bz2 extension.
+"""
+
+import bz2
+import gzip
+import lzma
+
+
+# First bytes of each type of compressed file
+MAGIC = [(b'\x1f\x8b','gz'),(b'\xfd7zXZ\x00','xz'),(b'BZh','bz2')]
+
+OPENERS = {'gz': gzip.open,'xz': lzma.open,'bz2': bz2.open}
+
+
+def compression(filename):
+
+    # Type of compression of the file, None if it isn't compressed
+    with open(filename,'rb') as f:
+        start = f.read(6)
+    for magic,comp in MAGIC:
+        if start.startswith(magic):
+            return comp
+    return None
+
+
+def open_input(filename,mode='rt'):
+
+    comp = compression(filename)
+    if comp is None:
+        return open(filename,mode)
+    return OPENERS[comp](filename,mode)
+
+
+def output_base(filename):
+
+    # Name the AUTOSPEC files are made from, without the compression extension
+    for ext in ('.gz','.xz','.bz2'):
+        if filename.endswith(ext):
+            return filename[:-len(ext)]
+    return filename
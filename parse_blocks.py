@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code shared by the chem and LAYERS readers to parse the numeric data blocks of both files:
+    blocks = split_blocks(text)
+    label,vals = parse_block(block,nlabel)
+
+Inputs:
+    text:  text of a file (or of one molecule of a chem file)
+    block:  text of one block from split_blocks
+    nlabel:  number of words in the label (optional, default is every word before the first
+             number, e.g. 'Altitudes' or 'Effective altitudes')
+
+Outputs:
+    split_blocks:  list of the text of each block, on one line
+    parse_block:  label (words before the values, joined by one space) and array of the values,
+                  ValueError if the block isn't numeric or (without nlabel) has no values
+
+Block structure, in both chem and LAYERS files:
+    label  #1  #2  #3  #4 ^
+    (data) ^
+    (last line of data, with or without ^)
+
+A block starts at a line that isn't blank and runs over every line after one that ends
+with ^, up to a blank line or a line without ^. The continued lines are first joined
+with one regular expression over the whole text (not line by line), so each line is then a
+whole block, and all values of a block are converted to floats in one call.
+"""
+
+import re
+
+import numpy as np
+
+
+# End of a line that is continued on the next line
+CONT = re.compile(r'\^[ \t\r]*\n')
+
+
+def split_blocks(text):
+
+    # Join each continued line to the next one (keeping the ^), then every line that
+    # isn't blank is a block
+    text = CONT.sub('^ ',text)
+
+    return [line for line in text.split('\n') if len(line) != 0 and not line.isspace()]
+
+
+def is_number(word):
+
+    try:
+        float(word)
+    except ValueError:
+        return False
+    return True
+
+
+def parse_block(block,nlabel=None):
+
+    # Don't use the label or the continuation markers (^)
+    words = block.replace('^',' ').split()
+    if nlabel is None:
+        # The label is every word before the first number (at least one word)
+        nlabel = 1
+        while nlabel < len(words) and not is_number(words[nlabel]):
+            nlabel += 1
+        # A line of text (e.g. a title) isn't a block
+        if nlabel == len(words):
+            raise ValueError('Block without values: '+repr(block))
+    if len(words) < nlabel or nlabel == 0:
+        raise ValueError('Block without a label: '+repr(block))
+
+    # Raises ValueError if the block isn't numeric
+    return ' '.join(words[:nlabel]),np.array(words[nlabel:],dtype=float)
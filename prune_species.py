@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to drop molecules whose interpolated mixing ratios are negligible in every layer, so
+their blocks (and line database entries) aren't in the AUTOSPEC files:
+    rule = prune_rule(spec)
+    keep,dropped = rule.apply(lay,names,mrs)
+
+Inputs:
+    spec:  threshold as a number or text, e.g. 1e-12 (largest mixing ratio of any layer) or
+           'column:1e-12' (column-weighted mean mixing ratio), or a PruneRule
+    lay:  parsed LayersFile the mixing ratios were interpolated onto
+    names, mrs:  molecule names and mixing ratios (molecules x layers) from interp_chem
+
+Outputs:
+    keep:  boolean array, True for the molecules that are kept
+    dropped:  list of dicts (name, largest mixing ratio, column-weighted mean) of the
+              molecules that are dropped
+
+AUTOSPECRenderer(...,prune=rule) drops the molecules before formatting them. make_AUTOSPEC
+writes a report of every LAYERS file next to its AUTOSPEC files (report_path), a JSON file
+with the rule, the molecules kept, dropped and not found in the chem file.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from coarsen_layers import column_weights
+from open_inputs import output_base
+
+
+class PruneRule:
+
+    def __init__(self,threshold,by='max'):
+
+        if by not in ('max','column'):
+            raise ValueError('Molecules are pruned by max or column, not '+repr(by))
+        self.threshold = float(threshold)
+        self.by = by
+
+
+    def __str__(self):
+
+        return self.by+':'+repr(self.threshold)
+
+
+    def apply(self,lay,names,mrs):
+
+        mrs = np.asarray(mrs,dtype=float).reshape(len(names),-1)
+        peak = np.max(np.abs(mrs),axis=1) if mrs.shape[1] else np.zeros(len(names))
+        # Fraction of the column, the weights are the column of each layer
+        w = column_weights(lay)
+        column = mrs @ w/np.sum(w) if mrs.shape[1] else np.zeros(len(names))
+
+        keep = (peak if self.by == 'max' else column) >= self.threshold
+        dropped = [{'name': names[k],'max': float(peak[k]),'column': float(column[k])}
+                   for k in np.flatnonzero(~keep)]
+
+        return keep,dropped
+
+
+def prune_rule(spec):
+
+    # PruneRule from a threshold, 'max:THRESHOLD' or 'column:THRESHOLD'
+    if spec is None or isinstance(spec,PruneRule):
+        return spec
+    spec = str(spec)
+    if ':' in spec:
+        by,threshold = spec.split(':',1)
+        return PruneRule(threshold,by)
+    return PruneRule(spec)
+
+
+def report_path(layersfile,outdir=None):
+
+    # Next to the AUTOSPEC files of the LAYERS file
+    layersfile = output_base(layersfile)
+    if outdir is not None:
+        layersfile = os.path.join(outdir,os.path.basename(layersfile))
+    return layersfile+'_pruned.json'
+
+
+def prune_report(render,mollist,rule):
+
+    # Text of the JSON report of one renderer
+    dropped = set([entry['name'] for entry in render.pruned])
+    report = {'layersfile': render.lay.filename,'chemfile': render.chem.filename,'rule': str(rule),
+              'kept': list(render.names),'dropped': render.pruned,
+              'missing': [mol for mol in mollist if mol not in render.names and mol not in dropped]}
+
+    return json.dumps(report,indent=1)+'\n'
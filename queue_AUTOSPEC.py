@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to share the jobs of a sweep between any number of worker processes on any number of
+nodes, through a queue directory on a shared file system (no server needed):
+    queue = JobQueue(qdir)
+    queue.submit(jobs)
+    work_queue(qdir,lease,poll,cache)
+
+    python queue_AUTOSPEC.py submit QUEUE MANIFEST [--skip-failed]
+    python queue_AUTOSPEC.py work QUEUE [--jobs N] [--lease SECONDS] [--poll SECONDS]
+                             [--cache CACHEDIR] [--cache-size MB] [--quiet | --verbose]
+    python queue_AUTOSPEC.py status QUEUE
+
+Inputs:
+    qdir:  path to the queue directory as a string (created if it doesn't exist), on a file
+           system every node can see at the same path
+    jobs:  list of jobs as for sweep_AUTOSPEC (or a CSV or JSON manifest, see sweep_AUTOSPEC.py)
+    lease:  seconds a claimed job is kept without a sign of life from its worker before it
+            goes back to the queue (optional, default 600)
+    poll:  seconds to wait before looking again when every job left is claimed by other
+           workers (optional, default 10)
+    cache:  InputCache for the worker (optional, see cache_inputs.py)
+
+Outputs:
+    submit:  number of jobs added to the queue
+    work_queue:  number of jobs run and number failed by this worker
+
+The queue has one JSON file per job, named by job_key (see journal_AUTOSPEC.py), in one of
+pending/, claimed/, done/ and failed/. A worker claims a job by renaming its file from
+pending/ to claimed/; a rename is atomic, so only one worker gets each job. While the job
+runs, the worker touches its file every lease/4 seconds. A claimed file that hasn't been
+touched for lease seconds (its worker died or its node went down) is renamed back to
+pending/ by the next worker that looks. A job claimed more than max_attempts times (default
+3) fails instead of killing more workers. Times are all file times of the shared file
+system, so the clocks of the nodes don't have to agree.
+
+Every worker runs until no job is pending or claimed. AUTOSPEC files are written atomically
+(see write_AUTOSPEC), so a job run twice (a worker that was only slow) writes the same files
+again and never leaves half a file. Submitting the same jobs again only adds the ones that
+aren't in the queue yet, and the jobs that failed (unless skip_failed).
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from journal_AUTOSPEC import job_key
+from prune_species import prune_rule
+from render_AUTOSPEC import as_clouds
+from timing_AUTOSPEC import logger, setup_logging
+
+
+# Directories of the queue, one per state of a job
+STATES = ('pending','claimed','done','failed')
+
+
+def job_record(job):
+
+    # JSON-safe job with absolute paths, so it runs the same on every node
+    outdir = job.get('outdir')
+    return {'layersfile': os.path.abspath(job['layersfile']),'chemfile': os.path.abspath(job['chemfile']),
+            'mollist': list(job['mollist']),'temp': job['temp'],
+            'clist': [list(calt) if isinstance(calt,(list,tuple)) else float(calt) for calt in job['clist']],
+            'outdir': None if outdir is None else os.path.abspath(outdir),'coarsen': job.get('coarsen'),
+            'prune': None if job.get('prune') is None else str(prune_rule(job['prune']))}
+
+
+def record_job(record):
+
+    # Job to run from a queue record, cloud decks back as CloudDeck
+    job = {key: record[key] for key in ('layersfile','chemfile','mollist','temp','outdir','coarsen','prune')}
+    job['clist'] = as_clouds(record['clist'])
+    return job
+
+
+class JobQueue:
+
+    def __init__(self,qdir,lease=600,max_attempts=3):
+
+        self.qdir = qdir
+        self.lease = lease
+        self.max_attempts = max_attempts
+        # Name of this worker in the claimed files
+        self.worker = socket.gethostname()+':'+str(os.getpid())
+        for state in STATES:
+            os.makedirs(os.path.join(qdir,state),exist_ok=True)
+
+
+    def path(self,state,name):
+
+        return os.path.join(self.qdir,state,name)
+
+
+    def names(self,state):
+
+        return sorted([name for name in os.listdir(os.path.join(self.qdir,state)) if name.endswith('.json')])
+
+
+    def counts(self):
+
+        return {state: len(self.names(state)) for state in STATES}
+
+
+    def now(self):
+
+        # Time of the shared file system, to compare with the times of the claimed files
+        clock = os.path.join(self.qdir,'clock')
+        with open(clock,'a'):
+            pass
+        os.utime(clock)
+        return os.stat(clock).st_mtime
+
+
+    def write(self,state,name,record):
+
+        # Write a job file to a temporary file and rename, so it's never half written
+        path = self.path(state,name)
+        tmp = path+'.'+self.worker.replace(':','.')+'.tmp'
+        with open(tmp,'w') as f:
+            json.dump(record,f)
+        os.replace(tmp,path)
+
+
+    def read(self,state,name):
+
+        with open(self.path(state,name)) as f:
+            return json.load(f)
+
+
+    def submit(self,jobs,skip_failed=False):
+
+        # Add the jobs that aren't in the queue yet (and the failed ones again)
+        known = {state: set(self.names(state)) for state in STATES}
+        n = 0
+        for job in jobs:
+            record = job_record(job)
+            name = job_key(record)+'.json'
+            if name in known['pending'] or name in known['claimed'] or name in known['done']:
+                continue
+            if name in known['failed']:
+                if skip_failed:
+                    continue
+                os.remove(self.path('failed',name))
+            record['attempts'] = 0
+            self.write('pending',name,record)
+            known['pending'].add(name)
+            n += 1
+
+        logger.info('Submitted %d of %d jobs to queue %s',n,len(jobs),self.qdir)
+
+        return n
+
+
+    def claim(self):
+
+        # Claim the first pending job no other worker gets to first, None if there isn't one
+        for name in self.names('pending'):
+            try:
+                # Fresh time first, so the job isn't taken back before it's written again
+                os.utime(self.path('pending',name))
+                os.rename(self.path('pending',name),self.path('claimed',name))
+            except FileNotFoundError:
+                continue
+
+            record = self.read('claimed',name)
+            record['attempts'] = record.get('attempts',0)+1
+            record['worker'] = self.worker
+            self.write('claimed',name,record)
+
+            if record['attempts'] > self.max_attempts:
+                self.finish(name,record,'Claimed %d times without finishing (worker killed?), last by %s'
+                            % (record['attempts']-1,self.worker))
+                continue
+
+            return name,record
+
+        return None
+
+
+    def renew(self,name):
+
+        # Touch a claimed job, False if the job isn't claimed any more
+        try:
+            os.utime(self.path('claimed',name))
+        except FileNotFoundError:
+            return False
+        return True
+
+
+    @contextlib.contextmanager
+    def heartbeat(self,name):
+
+        # Keep the lease of a job while it runs
+        stop = threading.Event()
+        def beat():
+            while not stop.wait(self.lease/4):
+                if not self.renew(name):
+                    logger.warning('Lost the lease of job %s, it may run twice',name)
+                    return
+        thread = threading.Thread(target=beat,daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+
+    def reap(self):
+
+        # Put the claimed jobs of dead workers back in the queue
+        now = self.now()
+        n = 0
+        for name in self.names('claimed'):
+            try:
+                if now-os.stat(self.path('claimed',name)).st_mtime < self.lease:
+                    continue
+                os.rename(self.path('claimed',name),self.path('pending',name))
+            except FileNotFoundError:
+                continue
+            logger.warning('Lease of job %s expired, back in the queue',name)
+            n += 1
+
+        return n
+
+
+    def finish(self,name,record,err=None):
+
+        # Move a claimed job to done/ or failed/ (with its error)
+        try:
+            if err is None:
+                os.replace(self.path('claimed',name),self.path('done',name))
+            else:
+                self.write('failed',name,dict(record,error=err))
+                os.remove(self.path('claimed',name))
+        except FileNotFoundError:
+            logger.warning('Job %s was taken back before it finished, it may run twice',name)
+
+
+def work_queue(qdir,lease=600,poll=10,cache=None,max_attempts=3):
+
+    # Code to run one job of a sweep
+    from sweep_AUTOSPEC import run_job
+
+    queue = JobQueue(qdir,lease,max_attempts)
+    ndone,nfailed = 0,0
+
+    while True:
+        queue.reap()
+        claim = queue.claim()
+
+        # Wait for jobs that may come back from dead workers, until none is left
+        if claim is None:
+            counts = queue.counts()
+            if counts['pending'] == 0 and counts['claimed'] == 0:
+                break
+            time.sleep(poll)
+            continue
+
+        name,record = claim
+        job = record_job(record)
+        if cache is not None:
+            job['cache'] = cache
+        with queue.heartbeat(name):
+            job,err,records = run_job(job)
+        queue.finish(name,record,err)
+
+        if err is None:
+            ndone += 1
+        else:
+            nfailed += 1
+            logger.error('Failed: %s %s\n%s',job['layersfile'],job['chemfile'],err)
+
+    logger.info('Worker %s ran %d jobs, %d failed',queue.worker,ndone+nfailed,nfailed)
+
+    return ndone+nfailed,nfailed
+
+
+def run_workers(qdir,workers,lease=600,poll=10,cache=None,max_attempts=3):
+
+    # Several workers on this node, each claims its own jobs
+    if workers == 1:
+        return [work_queue(qdir,lease,poll,cache,max_attempts)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(work_queue,qdir,lease,poll,cache,max_attempts) for i in range(workers)]
+        return [fut.result() for fut in futures]
+
+
+def main(argv=None):
+
+    # Code to read a manifest of jobs
+    from sweep_AUTOSPEC import read_manifest
+    # Code to cache parsed input files
+    from cache_inputs import InputCache
+
+    parser = argparse.ArgumentParser(description='Share the AUTOSPEC jobs of a sweep between nodes through a queue directory')
+    commands = parser.add_subparsers(dest='command',required=True)
+
+    submit = commands.add_parser('submit',help='add the jobs of a manifest to the queue')
+    submit.add_argument('queue',help='queue directory')
+    submit.add_argument('manifest',help='CSV or JSON manifest of jobs')
+    submit.add_argument('--skip-failed',action='store_true',help='don\'t submit jobs that failed again')
+
+    work = commands.add_parser('work',help='run jobs from the queue until none is left')
+    work.add_argument('queue',help='queue directory')
+    work.add_argument('--jobs','-j',type=int,default=1,help='number of worker processes on this node')
+    work.add_argument('--lease',type=float,default=600,help='seconds before the job of a dead worker is run again')
+    work.add_argument('--poll',type=float,default=10,help='seconds between looks at the queue when it is waiting')
+    work.add_argument('--attempts',type=int,default=3,help='times a job is claimed before it fails')
+    work.add_argument('--cache',default=None,help='directory to cache parsed input files in')
+    work.add_argument('--cache-size',type=float,default=1000,help='maximum cache size (MB)')
+
+    status = commands.add_parser('status',help='print the number of jobs in each state and the failures')
+    status.add_argument('queue',help='queue directory')
+
+    for command in (submit,work,status):
+        command.add_argument('--quiet','-q',action='store_true',help='only print warnings and errors')
+        command.add_argument('--verbose','-v',action='store_true',help='print every molecule and stage')
+    args = parser.parse_args(argv)
+
+    setup_logging(args.quiet,args.verbose)
+
+    if args.command == 'submit':
+        JobQueue(args.queue).submit(read_manifest(args.manifest),args.skip_failed)
+        return 0
+
+    if args.command == 'work':
+        cache = None
+        if args.cache is not None:
+            cache = InputCache(args.cache,args.cache_size*1e6)
+        results = run_workers(args.queue,args.jobs,args.lease,args.poll,cache,args.attempts)
+        return 1 if sum([nfailed for nrun,nfailed in results]) != 0 else 0
+
+    queue = JobQueue(args.queue)
+    counts = queue.counts()
+    print(' '.join(['%s %d' % (state,counts[state]) for state in STATES]))
+    for name in queue.names('failed'):
+        record = queue.read('failed',name)
+        print('Failed: %s %s: %s' % (record['layersfile'],record['chemfile'],record['error'].strip().splitlines()[-1]))
+    for name in queue.names('claimed'):
+        record = queue.read('claimed',name)
+        print('Claimed by %s: %s %s' % (record.get('worker'),record['layersfile'],record['chemfile']))
+
+    return 1 if counts['failed'] != 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to read back the AUTOSPEC files written by the make_AUTOSPEC codes:
+    read_AUTOSPEC(filename)
+
+Input:  AUTOSPEC file
+    filename:  path to AUTOSPEC file as a string
+
+Outputs:
+    Element 0:  reference temperature
+    Element 1:  dict of molecule name -> list of mixing ratios
+    Element 2:  list of CONT values for all layers
+
+The file can also be parsed into arrays:
+    af = AUTOSPECFile(filename)
+    af = AUTOSPECFile(filename,text)  (from text already read, e.g. from an archive)
+
+    af.params:  dict of every header and trailer parameter, name -> value text
+    af.temp:  reference temperature
+    af.names, af.flags:  molecule names and flags, in file order
+    af.values:  array of mixing ratios (molecules x layers)
+    af.cont:  array of CONT values
+    af.nlay:  number of layers
+    af.variant:  file suffix after _AUTOSPEC_ (None if the name doesn't have one)
+    af.cont_layers():  indices of the layers with a CONT value that isn't 0
+    af.document():  the file as an AUTOSPECDocument, document().text() writes it again
+
+Every AUTOSPEC file in a list of files, directories and archives (see archive_AUTOSPEC.py)
+is parsed one at a time, so only one file is in memory at once:
+    for af in iter_AUTOSPEC(paths):
+
+parse_variant(variant) gives the file type and its stellar temperature or cloud back from
+the variant name ('reflectance', 'emission' or 'emission_clouds').
+"""
+
+import os
+import re
+
+import numpy as np
+
+from archive_AUTOSPEC import archive_mode, iter_archive
+from format_AUTOSPEC import format_AUTOSPEC
+from open_inputs import open_input
+from parse_blocks import parse_block, split_blocks
+from render_AUTOSPEC import AUTOSPECDocument
+
+
+# Parameter name and value are separated by tabs or at least two spaces
+PARAM = re.compile(r'\t+| {2,}')
+
+# Header parameter with the reference temperature
+TEMP_PARAM = 'Temperature reference at spectrometer'
+
+# Variant names of emission files with a cloud (see cloud_name in render_AUTOSPEC.py)
+CLOUD = re.compile(r'emission_(-?[0-9.]+(?:e[-+][0-9]+)?)(?:-(-?[0-9.]+(?:e[-+][0-9]+)?))?km(?:_(.+))?$')
+
+
+def parse_variant(variant):
+
+    # (file type, stellar temperature or cloud) of a variant name, the inverse of
+    # reflectance_name and cloud_name
+    if variant == 'reflectance' or variant == 'emission':
+        return variant,None
+    if variant.startswith('reflectance_') and variant.endswith('K'):
+        return 'reflectance',variant[len('reflectance_'):-1]
+
+    match = CLOUD.match(variant)
+    if match is None:
+        raise ValueError('Unknown AUTOSPEC variant '+repr(variant))
+    top,bottom,opacity = match.groups()
+    if bottom is None:
+        return 'emission_clouds',float(top)
+    if opacity is None:
+        return 'emission_clouds',(float(top),float(bottom))
+    return 'emission_clouds',(float(top),float(bottom),float(opacity))
+
+
+class AUTOSPECFile:
+
+    # File structure:
+    # ! Parameter file for AUTOSPEC.
+    # (one parameter per line: name, tabs or spaces, value)
+    # Temperature reference at spectrometer		(reference temperature)
+    # ...
+    # Line databases	"SAO2012,UV_CROSS"
+    # \n
+    # 'name'   (flag)  #1 #2 #3 #4 #5 #6 ^
+    #	 #7 #8 #9 #10 #11 #12 ^
+    # (one block per molecule, last row without ^)
+    # CONT   0  (value for every layer, same rows)
+    # Base/base ...
+    # (trailer parameters)
+
+    def __init__(self,filename,text=None):
+
+        self.filename = filename
+        # Parameter name -> value text, header and trailer
+        self.params = {}
+        self.names = []
+        self.flags = []
+        self.cont = None
+
+        self.variant = None
+        if '_AUTOSPEC_' in os.path.basename(filename):
+            self.variant = os.path.basename(filename).split('_AUTOSPEC_',1)[1]
+
+        if text is None:
+            with open_input(filename) as f:
+                text = f.read()
+
+        self.read(text)
+
+
+    def read(self,text):
+
+        rows = []
+        # Header, molecule blocks (after Line databases, up to CONT), trailer
+        section = 'header'
+        for block in split_blocks(text):
+
+            if section == 'molecules':
+                # The label is the name and the flag (a number)
+                label,vals = parse_block(block,2)
+                name,flag = label.split()
+                if name == 'CONT':
+                    self.cont = vals
+                    section = 'trailer'
+                    continue
+                self.names.append(name)
+                self.flags.append(flag)
+                rows.append(vals)
+                continue
+
+            # Comment
+            if block.startswith('!'):
+                continue
+
+            param = PARAM.split(block.strip(),1)
+            if len(param) < 2:
+                raise ValueError('Line without a value in '+self.filename+': '+repr(block))
+            self.params[param[0]] = param[1].strip()
+            if param[0] == 'Line databases' and section == 'header':
+                section = 'molecules'
+
+        if self.cont is None:
+            raise ValueError('No CONT block in '+self.filename)
+        if TEMP_PARAM not in self.params:
+            raise ValueError('No reference temperature in '+self.filename)
+
+        # Every molecule has one mixing ratio per layer
+        lengths = set([len(vals) for vals in rows])
+        if len(lengths) > 1:
+            raise ValueError('Molecule blocks with '+', '.join([str(n) for n in sorted(lengths)])+
+                             ' layers in '+self.filename)
+        self.values = np.array(rows,dtype=float).reshape(len(rows),-1 if rows else len(self.cont))
+
+        self.temp = float(self.params[TEMP_PARAM])
+        self.nlay = len(self.cont)
+
+
+    def cont_layers(self):
+
+        return np.flatnonzero(self.cont)
+
+
+    def document(self):
+
+        # Same structure as made by the renderer, the CONT value of the first cloud layer
+        # is used for all of them
+        ind = self.cont_layers()
+        opacity = format_AUTOSPEC(self.cont[ind[:1]])[0] if len(ind) else format_AUTOSPEC([0.0])[0]
+        return AUTOSPECDocument(self.params[TEMP_PARAM],self.names,self.flags,self.values,ind,
+                                opacity=opacity)
+
+
+def is_archive(path):
+
+    try:
+        archive_mode(path)
+    except ValueError:
+        return False
+    return os.path.isfile(path)
+
+
+def iter_sources(paths):
+
+    # (filename, text) of every AUTOSPEC file in a list of files, directories and archives,
+    # text is None for files on disk (read when they're parsed)
+    # Files in an archive are named archive/name
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if '_AUTOSPEC_' in name and not name.endswith(('.tmp','.json')):
+                    yield os.path.join(path,name),None
+        elif is_archive(path):
+            for name,text in iter_archive(path):
+                if '_AUTOSPEC_' in name and not name.endswith('.json'):
+                    yield os.path.join(path,name),text
+        else:
+            yield path,None
+
+
+def iter_AUTOSPEC(paths):
+
+    for filename,text in iter_sources(paths):
+        yield AUTOSPECFile(filename,text)
+
+
+def read_AUTOSPEC(filename):
+
+    af = AUTOSPECFile(filename)
+
+    return af.temp,{af.names[k]: af.values[k].tolist() for k in range(len(af.names))},af.cont.tolist()
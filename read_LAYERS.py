@@ -10,11 +10,29 @@ Input:  LAYERS file
 Outputs:
     Element 0:  list of effective altitudes
     Element 1:  list of temperatures for all layers
+
+The LAYERS file can also be parsed once into a reusable object:
+    lay = LayersFile(filename)
+    lay = LayersFile(filename,blocks,n)  (from already parsed data, the file isn't read)
+
+    lay.n:  number of layers
+    lay.alt:  array of altitudes
+    lay.ealt:  array of effective altitudes
+    lay.temp:  array of temperatures for all layers
+    lay.blocks:  dict of every data block in the file, label -> array
+    lay.text():  the LAYERS file as text (e.g. to write merged layers, see coarsen_layers.py)
+
+LAYERS files compressed with gzip, xz or bzip2 are read directly (see open_inputs.py).
 """
 
-def read_LAYERS(filename):
-    
-    import numpy as np
+import numpy as np
+
+from open_inputs import open_input
+from parse_blocks import parse_block, split_blocks
+from timing_AUTOSPEC import TIMER
+
+
+class LayersFile:
     
     # File structure:
     # Very lowest layer    #
@@ -27,85 +45,93 @@ def read_LAYERS(filename):
     # (data, 4 elements per line) ^
     # (last line of data, no ^)
     
-    
-    # Open file
-    f = open(filename)
-    
-    rows = f.readlines()
-    
-    # Find the number of layers and where the effective altitudes start
-    for i in range(len(rows)):
+    def __init__(self,filename,blocks=None,n=0):
         
-        m1 = rows[i].find('Very lowest layer')
-        m2 = rows[i].find('Effective altitudes')
-        m3 = rows[i].find('Temperatures (K)')
+        self.filename = filename
+        self.n = n
+        # Label (first two words of the block) -> data
+        self.blocks = {}
         
-        # The 3rd element in the matching line for layers is the number of layers
-        if m1 != -1:
+        # Data that is already parsed (e.g. from a cache) doesn't need the file
+        if blocks is not None:
+            self.blocks = dict(blocks)
+        else:
+            self.read()
             
-            row = rows[i].split()
-            n = int(row[3])
-
-        # Starting point of effective altitudes
-        if m2 != -1:
-            ind1 = i
+        for label in self.blocks:
+            self.blocks[label] = np.asarray(self.blocks[label],dtype=float)
             
-        # Starting point of temperatures
-        if m3 != -1:
-            indT = i
+        self.alt = self.find('Altitudes')
+        self.ealt = self.find('Effective altitudes')
+        self.temp = self.find('Temperatures')
+        
+        
+    def read(self):
+        
+        with open_input(self.filename) as f:
+            text = f.read()
+        
+        # Single pass over the blocks of the file
+        for block in split_blocks(text):
+            row = block.split()
             
+            # The 3rd element in the matching line for layers is the number of layers
+            if row[:3] == ['Very','lowest','layer']:
+                self.n = int(row[3])
+                continue
             
-    # Calculate number of lines of altitude data
-    # There will be n elements of data with 4 elements per line
-    nrow = int(np.ceil(n/4))
-    
-    # Read effective altitude data
-    ealt = []
-    # For the first row don't read in the first two and last elements
-    # The first row will be the second list of altitudes
-    row = rows[ind1].split()
-    for i in range(2,len(row)-1):
-        ealt.append(float(row[i]))
-    
-    ind2 = ind1+nrow-1
-    # For the 'middle rows' use every element except the last (^)
-    for i in range(ind1+1,ind2):
-        row = rows[i].split()
-        for k in range(len(row)-1):
-            ealt.append(float(row[k]))
+            if len(row) < 3:
+                continue
             
-    # For the last row read in all elements
-    row = rows[ind2].split()
-    for i in range(len(row)):
-        ealt.append(float(row[i]))
+            # A single line that isn't numeric (e.g. a title) isn't a data block
+            try:
+                label,vals = parse_block(block)
+            except ValueError:
+                if '^' in block:
+                    raise
+                continue
+            self.blocks[label] = vals
+
+        
+    def text(self):
         
+        # Number of layers, then every block with 4 values per line, written so that
+        # LayersFile reads back exactly the same values
+        lines = ['Very lowest layer    '+str(self.n),'']
+        for label,vals in self.blocks.items():
+            if len(vals) == 0:
+                continue
+            vals = [repr(float(v)) for v in vals]
+            rows = ['   '.join(vals[i:i+4]) for i in range(0,len(vals),4)]
+            lines.append(label+'   '+' ^\n'.join(rows))
+            lines.append('')
         
-    # Read temperature data
-    t = []
-    # For the first row don't read in the first two and last elements
-    # The first row will be the second list of altitudes
-    row = rows[indT].split()
-    for i in range(2,len(row)-1):
-        t.append(float(row[i]))
+        return '\n'.join(lines)+'\n'
     
-    ind2 = indT+nrow-1
-    # For the 'middle rows' use every element except the last (^)
-    for i in range(indT+1,ind2):
-        row = rows[i].split()
-        for k in range(len(row)-1):
-            t.append(float(row[k]))
-            
-    # For the last row read in all elements
-    row = rows[ind2].split()
-    for i in range(len(row)):
-        t.append(float(row[i]))
+    
+    def find(self,label):
         
-
+        # Return the first block whose label starts with the given text
+        for key in self.blocks:
+            if key.startswith(label):
+                return self.blocks[key]
+        return np.array([])
     
-
-    return ealt,t
+    
+def load_layers_file(layersfile,cache=None):
+    
+    # Accept either a path to a LAYERS file or an already parsed LayersFile
+    if isinstance(layersfile,LayersFile):
+        return layersfile
+    with TIMER.stage('parse_layers',layersfile):
+        # Parsed files can be kept in an InputCache
+        if cache is not None:
+            return cache.layers(layersfile)
+        return LayersFile(layersfile)
 
 
+def read_LAYERS(filename):
     
-    
+    lay = LayersFile(filename)
 
+    return lay.ealt.tolist(),lay.temp.tolist()
@@ -11,98 +11,238 @@ Inputs: chem file name, molecule name
 Outputs:
     Element 0: list of mixing ratios
     Element 1: list of corresponding altitudes (km)
+
+The chem file can also be parsed once and every molecule looked up from memory:
+    chem = ChemFile(filename)
+    chem = ChemFile(filename,species)  (from already parsed data, the file isn't read)
+    alt,mr = chem.species[molname]
+
+    chem.species:  dict of molecule name -> (altitude array (km), mixing ratio array)
+
+For very large chem files, MappedChemFile memory-maps the file and indexes the byte range of
+each molecule in one scan. A molecule is only parsed when it is looked up:
+    chem = MappedChemFile(filename)
+    alt,mr = chem.lookup(molname)  (None if the molecule isn't found)
+    chem.names():  list of molecules in the file
+    chem.species:  dict of the molecules parsed so far
+
+Chem files compressed with gzip, xz or bzip2 are read directly (see open_inputs.py).
+MappedChemFile decompresses them into memory instead of mapping them.
 """
 
+import mmap
 
+import numpy as np
 
-def read_chem_files(filename,molname):
+from open_inputs import compression, open_input
+from parse_blocks import parse_block, split_blocks
+from timing_AUTOSPEC import TIMER
+
+
+def parse_molecule(text):
+    
+    # Text of one molecule (after its Molecule line), returns altitudes and mixing
+    # ratios, or None if the blocks are missing
+    # The mixing ratio block comes first, then the altitude block
+    blocks = split_blocks(text)
+    if len(blocks) < 2:
+        return None
+    
+    # Labels are NAME MR and NAME ALT (a name could look like a number, e.g. INF)
+    mr = parse_block(blocks[0],2)[1]
+    alt = parse_block(blocks[1],2)[1]
+    
+    return alt,mr
+
+
+def scan_molecules(text):
+    
+    # (name, start, end) of every molecule in the text (str, bytes or memory map) of a chem
+    # file, each molecule runs from the line after its Molecule line up to the next one
+    word,nl = b'Molecule',b'\n'
+    if isinstance(text,str):
+        word,nl = 'Molecule','\n'
+    
+    molecules = []
+    name = None
+    start = 0
+    pos = text.find(word)
+    while pos != -1:
+        line0 = text.rfind(nl,0,pos)+1
+        line1 = text.find(nl,pos)
+        if line1 == -1:
+            line1 = len(text)
+        if name is not None:
+            molecules.append((name,start,line0))
+        name = text[line0:line1].split()[1]
+        if isinstance(name,bytes):
+            name = name.decode()
+        start = line1+1
+        pos = text.find(word,line1)
+        
+    # The last molecule ends at the end of the file
+    if name is not None:
+        molecules.append((name,start,len(text)))
+        
+    return molecules
+
+
+class ChemFile:
     
     # File structure:
     # Molecule 'name'
     # \n
-    # 'name' _ALT (altitude data) ^
-    # (altitude data) ^
-    # \n
     # 'name' _MR (mixing ratio data) ^
     # (mixing ratio data) ^
     # \n
+    # 'name' _ALT (altitude data) ^
+    # (altitude data) ^
+    # \n
+    
+    def __init__(self,filename,species=None):
+        
+        self.filename = filename
+        # Molecule name -> (altitudes, mixing ratios)
+        self.species = {}
+        
+        # Data that is already parsed (e.g. from a cache) doesn't need the file
+        if species is not None:
+            self.species = dict(species)
+            return
+        
+        with open_input(filename) as f:
+            text = f.read()
+        
+        # Single pass over the file
+        for name,start,end in scan_molecules(text):
+            self._add(name,text[start:end])
+            
+            
+    def _add(self,name,text):
+        
+        # Keep the first entry of each molecule, which needs both blocks
+        if name in self.species:
+            return
+        data = parse_molecule(text)
+        if data is not None:
+            self.species[name] = data
+        
+        
+    def names(self):
+        
+        # Molecules in the file, in file order
+        return list(self.species)
+    
     
-    f = open(filename)
+    def lookup(self,molname):
+        
+        # Returns altitudes and mixing ratios, None if the molecule isn't found
+        return self.species.get(molname)
     
-    rows = f.readlines()
     
+    def __contains__(self,molname):
+        return self.lookup(molname) is not None
     
-    # Search all rows for molecule name
-    # Start and end indicies of molecule
-    ind1 = 0
-    ind2 = 0
-    for i in range(len(rows)):
-        m = rows[i].find('Molecule '+molname+' ')
+    
+    def get(self,molname):
         
-        # If it is found, extract data
-        if m != -1:
-            ind1 = i
-            
-            # Find the end of the data (the beginning of the next molecule)
-            for k in range(i+1,len(rows)):
-                # Look for the next iteration of the word 'Molecule'
-                m2 = rows[k].find('Molecule')
-                
-                if m2 != -1 and ind2 == 0:
-                    ind2 = k
-                    
-                    
-            # If this was the last molecule, just use the last index
-            if ind2 == 0:
-                ind2 = len(rows) + 1
-                
+        # Returns mixing ratios and altitudes, empty if the molecule isn't found
+        data = self.lookup(molname)
+        if data is None:
+            return np.array([]),np.array([])
+        alt,mr = data
+        return mr,alt
+    
+    
+class MappedChemFile(ChemFile):
+    
+    # Memory-mapped chem file: one scan builds the byte range of each Molecule block,
+    # and a molecule is only parsed (from its own bytes) when it is looked up
+    
+    def __init__(self,filename):
+        
+        self.filename = filename
+        # Molecules parsed so far
+        self.species = {}
+        # Molecule name -> (start,end) byte offsets of its rows
+        self.index = {}
+        self.mm = None
+        
+        if compression(filename) is not None:
+            # A compressed file is decompressed into memory instead, bytes have the same
+            # find and slicing as the memory map
+            with open_input(filename,'rb') as f:
+                self.mm = f.read()
+        else:
+            with open(filename,'rb') as f:
+                try:
+                    self.mm = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty file
+                    return
                 
+        # Scan for the Molecule lines
+        for name,start,end in scan_molecules(self.mm):
+            if name not in self.index:
+                self.index[name] = (start,end)
+            
+            
+    def names(self):
+        
+        return list(self.index)
     
-    # Extract altitudes and mixing ratios
-    mr = []
-    alt = []
     
-    # Calculate number of data rows
-    drow = int((ind2-ind1 - 4)/2)
+    def lookup(self,molname):
         
-    # Mixing ratios
-    # First row don't use the first two elements
-    row = rows[ind1+2].split()
-    for i in range(2,len(row)-1):
-        mr.append(float(row[i]))
-    # For all other rows don't use the last element
-    for i in range(ind1+3,ind1+2+drow):
-        row = rows[i].split()
+        if molname in self.species:
+            return self.species[molname]
+        if molname not in self.index:
+            return None
         
-        for k in range(len(row)-1):
-            mr.append(float(row[k]))
+        # Parse only the bytes of this molecule
+        start,end = self.index[molname]
+        data = parse_molecule(self.mm[start:end].decode())
+        if data is not None:
+            self.species[molname] = data
+        else:
+            del self.index[molname]
             
-    # Altitudes
-    # First row don't use the first two elements
-    row = rows[ind1+3+drow].split()
-    for i in range(2,len(row)-1):
-        alt.append(float(row[i]))
-    # For all other rows don't use the last element
-    for i in range(ind1+4+drow,ind1+4+2*drow-1):
-        row = rows[i].split()
-        
-        for k in range(len(row)-1):
-            alt.append(float(row[k]))
-
+        return data
+    
+    
+    def close(self):
         
-    # Return mixing ratios and altitudes
-    return mr,alt
-                
+        if isinstance(self.mm,mmap.mmap):
+            self.mm.close()
+        self.mm = None
+            
+            
+    def __enter__(self):
+        return self
     
-
-
-
     
+    def __exit__(self,*args):
+        self.close()
     
     
- 
-
-
-
+def load_chem_file(chemfile,cache=None):
+    
+    # Accept either a path to a chem file or an already parsed ChemFile
+    if isinstance(chemfile,ChemFile):
+        return chemfile
+    with TIMER.stage('parse_chem',chemfile):
+        # Parsed files can be kept in an InputCache
+        if cache is not None:
+            return cache.chem(chemfile)
+        # Only the molecules that are used get parsed
+        return MappedChemFile(chemfile)
 
 
+def read_chem_files(filename,molname):
+    
+    # Index the file and parse only this molecule
+    with MappedChemFile(filename) as chem:
+        mr,alt = chem.get(molname)
+        
+    # Return mixing ratios and altitudes
+    return mr.tolist(),alt.tolist()
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to render the text of reflectance and emission AUTOSPEC files from shared molecule blocks:
+    render = AUTOSPECRenderer(layersfile,chemfile,mollist)
+
+Inputs: LAYERS file, chem file, molecule list
+    layersfile:  path to LAYERS file as a string (or a parsed LayersFile)
+    chemfile:  path to chem file as a string (or a parsed ChemFile)
+    mollist: list of molecules (all as strings written exactly as in the chem file)
+    log:  if True, interpolate the logarithm of the mixing ratios (optional)
+    weights:  dict of interpolation weights to reuse between renderers (optional)
+    prune:  PruneRule (or threshold) to drop molecules that are negligible in every layer,
+            render.pruned lists them (optional, see prune_species.py)
+
+The molecules are interpolated and formatted once. Each file is then made by swapping
+only the header temperature, the first reflectance value and the CONT row:
+    render.reflectance(temp):  text of the reflectance file
+    render.reflectance_parts(temp):  the same text in two parts, the header up to the stellar
+                                     temperature and the rest, which is shared by every temperature
+    render.emission():  text of the emission file
+    render.emission_clouds(calt):  text of the emission file with a cloud layer at calt (km)
+    render.emission_clouds_list(clist):  texts of the emission files for every cloud in clist
+    render.document(variant,temp,calt):  the same file as an AUTOSPECDocument
+
+A cloud is either an altitude (km) of a thin cloud in the closest layer, or a deck
+CloudDeck(top,bottom) or CloudDeck(top,bottom,opacity) covering every layer from the one
+closest to top to the one closest to bottom. The default opacity is 1.00E-05. parse_cloud reads
+a cloud from text ('12.0', '12.0:6.0' or '12.0:6.0:1E-4'), as_clouds makes every cloud of a
+list one of the two (text is parsed, and a list or tuple in a cloud list, e.g. from JSON, is
+a deck), and cloud_name gives the file suffix of the cloud (emission_12.0km,
+emission_12.0-6.0km or emission_12.0-6.0km_1.00E-04). Reflectance files
+for a list of stellar temperatures are named by reflectance_name (reflectance_4286.00K).
+
+The files listed by output_files (build_AUTOSPEC.py) are rendered in order with:
+    for path,text in render_files(render,files,temp):
+
+Whole models can be rendered without writing any files:
+    docs = render_AUTOSPEC(layersfile,chemfile,mollist,temp,clist,form,prune)
+
+    form:  'text' (default), 'bytes' or 'document'
+    docs:  dict of variant -> file, the variants are 'reflectance' (or reflectance_name(temp)
+           for each temperature if temp is a list), 'emission' and cloud_name(calt) for each
+           cloud (the file suffix after _AUTOSPEC_)
+"""
+
+import os
+
+import numpy as np
+
+from format_AUTOSPEC import format_AUTOSPEC, format_blocks, format_row, format_rows, join_block
+from interp_chem import interp_chem
+from prune_species import prune_rule
+from read_chem_files import load_chem_file
+from read_LAYERS import load_layers_file
+from timing_AUTOSPEC import TIMER, logger
+
+
+# Header text before and after the reference temperature
+HEADER = ('! Parameter file for AUTOSPEC.\n'
+          '\n'
+          'Model number			1\n'
+          'Ray number/ray			1\n'
+          '\n'
+          'Lab spectrum?			0\n'
+          'Absorption spectrum?		0\n'
+          'Pade Adjustable parameter	0.7\n'
+          'Perfect ends?			1\n'
+          'Smearing function code		4\n'
+          '\n'
+          'Wavenumber shift/shift				0.000\n'
+          'Step size (cm-1)				0.01\n'
+          'Extra calculation range beyond limits		250.0\n'
+          'Minimum line depth for inclusion in output	1.0e-5\n'
+          'Wing cutoff					1.0e-6\n'
+          'Validity range for Van Vleck-Weisskopf factors	10.0\n'
+          'Voigt/Lorentz switchover point (A-value)	2.0\n'
+          'Voigt core width (Gaussian half-widths)		12.0\n'
+          '\n'
+          'Width of instrumental smearing profile (cm-1)	0.1\n'
+          'Sinc function asymmetry/asymmetry		0.0\n'
+          'Instrument Entrance Diameter                    0.4\n'
+          'Instrument Focal Length                         58.0\n'
+          'Temperature reference at spectrometer		')
+
+HEADER_END = ('\n'
+              'Maximum points in smearing function		20\n'
+              '\n'
+              'Line databases	"SAO2012,UV_CROSS"\n'
+              '\n')
+
+# Remaining necessary text after the CONT row
+TRAILER = ('Base/base     0  0.00E+00    0  0.00E+00    0  0.00E+00\n'
+           'Height/height 0  1.00E+00    0  0.00E+00    0  0.00E+00\n'
+           '\n'
+           'Number of iterations	0\n'
+           'Epsilon one		1.E-4\n'
+           'Epsilon two		1.E-3\n'
+           'Lambda			.01\n'
+           'Nu			10.\n'
+           '\n')
+
+# Cloud (and reflectance surface) opacity written in the CONT row
+CONT_ON = '1.00E-05'
+CONT_OFF = '0.00E+00'
+
+
+class CloudDeck(tuple):
+
+    # Cloud deck (top, bottom) or (top, bottom, opacity), a tuple of floats so it's indexed,
+    # compared and hashed like one
+
+    def __new__(cls,top,bottom,opacity=None):
+
+        vals = [float(top),float(bottom)]
+        if opacity is not None:
+            vals.append(float(opacity))
+        return tuple.__new__(cls,vals)
+
+
+    def __getnewargs__(self):
+
+        return tuple(self)
+
+
+def parse_cloud(text):
+
+    # '12.0' is a thin cloud, '12.0:6.0' a deck and '12.0:6.0:1E-4' a deck with its opacity
+    vals = [float(v) for v in str(text).split(':')]
+    if len(vals) == 1:
+        return vals[0]
+    if len(vals) > 3:
+        raise ValueError('A cloud is ALT, TOP:BOTTOM or TOP:BOTTOM:OPACITY, not '+repr(text))
+    return CloudDeck(*vals)
+
+
+def as_cloud(cloud):
+
+    # Altitude (unchanged, it names the file) or CloudDeck of one cloud in a cloud list
+    if isinstance(cloud,CloudDeck):
+        return cloud
+    if isinstance(cloud,str):
+        return parse_cloud(cloud)
+    if np.ndim(cloud) == 0:
+        return cloud
+    if len(cloud) not in (2,3):
+        raise ValueError('A cloud deck is (top, bottom) or (top, bottom, opacity), not '+repr(cloud))
+    return CloudDeck(*cloud)
+
+
+def as_clouds(clist):
+
+    return [as_cloud(cloud) for cloud in clist]
+
+
+def cloud_opacity(cloud):
+
+    # Opacity of a cloud deck as it's written in the CONT row
+    if np.ndim(cloud) == 0 or len(cloud) < 3:
+        return CONT_ON
+    return format_AUTOSPEC([cloud[2]])[0]
+
+
+def reflectance_name(temp):
+
+    # Variant name of the reflectance file for one of many stellar temperatures
+    return 'reflectance_'+str(temp)+'K'
+
+
+def cloud_name(cloud):
+
+    # Variant name (file suffix after _AUTOSPEC_) of the emission file with this cloud
+    if np.ndim(cloud) == 0:
+        if isinstance(cloud,np.generic):
+            cloud = cloud.item()
+        return 'emission_'+str(cloud)+'km'
+
+    top,bottom = [float(v) for v in cloud[:2]]
+    name = 'emission_'+str(top)+'-'+str(bottom)+'km'
+    if len(cloud) > 2:
+        name = name+'_'+cloud_opacity(cloud)
+    return name
+
+
+class AUTOSPECDocument:
+
+    # Structured AUTOSPEC file:
+    # header (with the reference temperature)
+    # one block per molecule: name, flag (1 for the first molecule of the list), mixing ratios
+    # CONT row with the opacity (1.00E-05) at layer index cont (or each index of a list)
+    # trailer
+
+    def __init__(self,temp,names,flags,values,cont,body=None,cont_text=None,opacity=CONT_ON):
+
+        self.header = HEADER
+        self.temp = str(temp)
+        self.header_end = HEADER_END
+        self.names = list(names)
+        self.flags = list(flags)
+        # Mixing ratios (molecules x layers)
+        self.values = values
+        self.cont = cont
+        self.opacity = opacity
+        self.trailer = TRAILER
+
+        # Text already formatted by the renderer, so it isn't formatted again
+        # (set to None after changing the molecules or the CONT index)
+        self.body = body
+        self.cont_text = cont_text
+
+
+    def rows(self):
+
+        # (name, flag, mixing ratios) of each molecule
+        return [(self.names[k],self.flags[k],self.values[k]) for k in range(len(self.names))]
+
+
+    def text(self):
+
+        body = self.body
+        if body is None:
+            body = ''.join(format_blocks(self.names,self.flags,self.values))
+        cont = self.cont_text
+        if cont is None:
+            vals = [CONT_OFF]*np.shape(self.values)[-1]
+            for ind in np.atleast_1d(self.cont):
+                vals[ind] = self.opacity
+            cont = join_block('CONT','0',format_rows(vals))
+
+        return self.header+self.temp+self.header_end+body+cont+self.trailer
+
+
+    def encode(self):
+
+        return self.text().encode()
+
+
+class AUTOSPECRenderer:
+
+    def __init__(self,layersfile,chemfile,mollist,log=False,weights=None,prune=None):
+
+        self.lay = load_layers_file(layersfile)
+        self.chem = load_chem_file(chemfile)
+
+        self.ealt = self.lay.ealt
+        self.nlay = len(self.ealt)
+        # Reference temperature for emission is the temperature of the lowest layer
+        self.tlow = str(float(self.lay.temp[-1]))
+
+        # Interpolate all molecules found onto the LAYERS effective altitudes at once
+        with TIMER.stage('interpolate',self.lay.filename,molecules=len(mollist)):
+            self.names,self.mrs = interp_chem(self.chem,mollist,self.ealt,log,weights)
+
+        # Extracts relevant molecules from chem files
+        flags = []
+        for i in range(len(mollist)):
+
+            # If there isn't a match
+            if mollist[i] not in self.chem:
+                logger.info('%s not found in %s, excluding from AUTOSPEC',mollist[i],self.chem.filename)
+                continue
+            logger.debug('%s found, adding to AUTOSPEC',mollist[i])
+
+            # If it is the first molecule in the list the flag will be 1
+            flags.append('1' if i == 0 else '0')
+
+        # Drop the molecules that are negligible in every layer (their flags go with them)
+        self.pruned = None
+        prune = prune_rule(prune)
+        if prune is not None:
+            keep,self.pruned = prune.apply(self.lay,self.names,self.mrs)
+            for entry in self.pruned:
+                logger.info('%s negligible (%s %.2E < %.2E), excluding from AUTOSPEC',
+                            entry['name'],prune.by,entry[prune.by],prune.threshold)
+            self.names = [self.names[k] for k in np.flatnonzero(keep)]
+            flags = [flags[k] for k in np.flatnonzero(keep)]
+            self.mrs = self.mrs[keep]
+
+        self.flags = flags
+
+        # Convert all numbers to fortran format at once
+        with TIMER.stage('format',self.lay.filename,molecules=len(self.names)):
+            emission = format_blocks(self.names,flags,self.mrs)
+
+        # If this is a reflectance spectrum the first mixing ratio should be 0.00E+00
+        reflectance = []
+        for k in range(len(emission)):
+            n = len(self.names[k])+len(flags[k])+5
+            v = emission[k].index(' ',n)
+            reflectance.append(emission[k][:n]+CONT_OFF+emission[k][v:])
+
+        self.body_emission = ''.join(emission)
+        self.body_reflectance = ''.join(reflectance)
+
+        # CONT rows with every value 0.00E+00, one row is re-rendered for each file
+        self.cont_rows = format_rows([CONT_OFF]*self.nlay)
+
+        # Sorted distinct effective altitudes, and the first layer with each of them (the
+        # sort is stable), to look up the layers of many clouds at once
+        order = np.argsort(self.ealt,kind='stable')
+        self.sorted_ealt,start = np.unique(self.ealt[order],return_index=True)
+        self.first_layer = order[start]
+
+        # Text of the reflectance file after the stellar temperature, made on first use
+        self.reflectance_tail = None
+
+
+    def cont(self,ind,opacity=CONT_ON):
+
+        # CONT row with the opacity (1.00E-05) at layer index ind (or every index of a list),
+        # only their rows need formatting
+        changed = {}
+        for i in np.atleast_1d(ind).tolist():
+            changed.setdefault(i//6,[]).append(i)
+
+        rows = list(self.cont_rows)
+        for r in changed:
+            vals = [CONT_OFF]*min(6,self.nlay-6*r)
+            for i in changed[r]:
+                vals[i-6*r] = opacity
+            rows[r] = format_row(vals,r == len(rows)-1)
+
+        return join_block('CONT','0',rows)
+
+
+    def cloud_layers(self,calts):
+
+        # Index of the layer with the closest effective altitude for every cloud altitude,
+        # the same layer as np.argmin(np.abs(ealt-calt)) (the first one if two are as close)
+        calts = np.asarray(calts,dtype=float)
+        alts = self.sorted_ealt
+        first = self.first_layer
+
+        # Closest altitudes below and above each cloud
+        pos = np.searchsorted(alts,calts)
+        lo = np.clip(pos-1,0,len(alts)-1)
+        hi = np.clip(pos,0,len(alts)-1)
+        dlo = np.abs(alts[lo]-calts)
+        dhi = np.abs(alts[hi]-calts)
+
+        return np.where(dlo < dhi,first[lo],np.where(dhi < dlo,first[hi],np.minimum(first[lo],first[hi])))
+
+
+    def cloud_layer(self,calt):
+
+        # Index of layer with closest cloud altitude
+        return int(self.cloud_layers([calt])[0])
+
+
+    def cloud_conts(self,clist):
+
+        # (layer indices, opacity) of the CONT row for each cloud
+        # All thin clouds are looked up at once
+        thin = [k for k in range(len(clist)) if np.ndim(clist[k]) == 0]
+        inds = self.cloud_layers([clist[k] for k in thin])
+
+        conts = [None]*len(clist)
+        for k,ind in zip(thin,inds.tolist()):
+            conts[k] = (ind,CONT_ON)
+
+        # Decks cover every layer from the one closest to the top to the one closest to the bottom
+        for k in range(len(clist)):
+            if conts[k] is None:
+                i,j = self.cloud_layers(clist[k][:2]).tolist()
+                conts[k] = (list(range(min(i,j),max(i,j)+1)),cloud_opacity(clist[k]))
+
+        return conts
+
+
+    def reflectance_parts(self,temp):
+
+        # Reference temperature is the temperature of the star
+        # For a reflectance spectrum, the first CONT value should be 1.00E-05
+        # Only the header line with the temperature changes between stellar temperatures
+        with TIMER.stage('render',self.lay.filename,variant='reflectance'):
+            if self.reflectance_tail is None:
+                self.reflectance_tail = HEADER_END+self.body_reflectance+self.cont(0)+TRAILER
+            return [HEADER+str(temp),self.reflectance_tail]
+
+
+    def reflectance(self,temp):
+
+        return ''.join(self.reflectance_parts(temp))
+
+
+    def emission(self):
+
+        # Reference temperature is the temperature at the lowest layer
+        # For an emission spectrum, the last CONT value should be 1.00E-05
+        with TIMER.stage('render',self.lay.filename,variant='emission'):
+            return HEADER+self.tlow+HEADER_END+self.body_emission+self.cont(self.nlay-1)+TRAILER
+
+
+    def emission_clouds(self,calt):
+
+        # For an emission spectrum with clouds, the altitude of clouds should be 1.00E-05
+        return self.emission_clouds_list([calt])[0]
+
+
+    def emission_clouds_list(self,clist):
+
+        # Emission files for many clouds, sharing the molecule blocks
+        texts = []
+        for calt,(ind,opacity) in zip(clist,self.cloud_conts(clist)):
+            logger.debug('%s km: layer %s',calt,np.add(ind,1))
+            with TIMER.stage('render',self.lay.filename,variant=cloud_name(calt)):
+                texts.append(HEADER+self.tlow+HEADER_END+self.body_emission+self.cont(ind,opacity)+TRAILER)
+
+        return texts
+
+
+    def document(self,variant,temp=None,calt=None):
+
+        # Reflectance: stellar temperature, first mixing ratio of each molecule 0.00E+00, and
+        # 1.00E-05 in the first CONT value
+        if variant == 'reflectance':
+            values = np.array(self.mrs,dtype=float)
+            values[:,:1] = 0.0
+            return AUTOSPECDocument(temp,self.names,self.flags,values,0,
+                                    self.body_reflectance,self.cont(0))
+
+        # Emission: temperature of the lowest layer, 1.00E-05 in the last CONT value or at
+        # the cloud layers
+        ind,opacity = self.nlay-1,CONT_ON
+        if calt is not None:
+            ind,opacity = self.cloud_conts([calt])[0]
+        return AUTOSPECDocument(self.tlow,self.names,self.flags,self.mrs,ind,
+                                self.body_emission,self.cont(ind,opacity),opacity)
+
+
+def render_AUTOSPEC(layersfile,chemfile,mollist,temp,clist,form='text',prune=None):
+
+    if form not in ('text','bytes','document'):
+        raise ValueError('form must be text, bytes or document, not '+repr(form))
+
+    # All AUTOSPEC files of one model, without writing them
+    render = AUTOSPECRenderer(layersfile,chemfile,mollist,prune=prune)
+    clist = as_clouds(clist)
+
+    # One reflectance file for each stellar temperature if there is a list of them
+    temps = {'reflectance': temp}
+    if isinstance(temp,(list,tuple)):
+        temps = {reflectance_name(t): t for t in temp}
+
+    if form == 'document':
+        docs = {variant: render.document('reflectance',temps[variant]) for variant in temps}
+        docs['emission'] = render.document('emission')
+        for calt in clist:
+            docs[cloud_name(calt)] = render.document('emission_clouds',calt=calt)
+        return docs
+
+    docs = {variant: render.reflectance(temps[variant]) for variant in temps}
+    docs['emission'] = render.emission()
+    texts = render.emission_clouds_list(clist)
+    for k in range(len(clist)):
+        docs[cloud_name(clist[k])] = texts[k]
+
+    if form == 'bytes':
+        docs = {variant: docs[variant].encode() for variant in docs}
+
+    return docs
+
+
+def render_files(render,files,temp):
+
+    # Text of each file (variant, stellar temperature or cloud, path) from output_files in
+    # build_AUTOSPEC.py, as (path, text)
+    # The layers of all clouds are looked up at once
+    clouds = [param for variant,param,path in files if variant == 'emission_clouds']
+    cloud_texts = iter(render.emission_clouds_list(clouds))
+
+    for variant,param,path in files:
+
+        # Reflectance file (one for each stellar temperature of a list)
+        # Only the header line with the temperature is made for each file
+        if variant == 'reflectance':
+            yield path,render.reflectance_parts(temp if param is None else param)
+
+        # Emission file
+        elif variant == 'emission':
+            yield path,render.emission()
+
+        # Emission files with clouds, only the CONT row changes for each cloud
+        else:
+            yield path,next(cloud_texts)
+
+
+def write_AUTOSPEC(filename,text):
+
+    # Write a whole AUTOSPEC file at once, text can also be a list of parts (e.g. from
+    # reflectance_parts) so shared parts aren't copied
+    # Written to a temporary file and renamed, so a killed job never leaves half a file
+    tmp = filename+'.'+str(os.getpid())+'.tmp'
+    with TIMER.stage('write',filename):
+        try:
+            with open(tmp,'w') as f:
+                if isinstance(text,str):
+                    f.write(text)
+                else:
+                    f.writelines(text)
+            os.replace(tmp,filename)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    logger.info('Created AUTOSPEC file %s',filename)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line code to create AUTOSPEC files for whole directories of LAYERS and chem files:
+    python run_AUTOSPEC.py LAYERS [LAYERS ...] --chem CHEM --molecules MOLFILE --temp TEMP [TEMP ...]
+                           [--clouds CALT [CALT ...]] [--cloud-grid START STOP STEP]
+                           [--outdir OUTDIR] [--coarsen TOL] [--prune [column:]THRESHOLD] [--jobs N]
+                           [--cache CACHEDIR] [--cache-size MB] [--build BUILDFILE]
+                           [--archive ARCHIVE] [--journal JOURNAL [--skip-failed]] [--queue QUEUE]
+                           [--quiet | --verbose] [--timing JSONFILE]
+
+Inputs:
+    LAYERS:  LAYERS files or globs (quote globs so the shell doesn't expand them)
+    --chem:  chem file, glob, or pairing pattern (see below)
+    --molecules:  file with the molecule list (names separated by spaces or new lines, # comments)
+    --temp:  stellar host temperature as a string with two decimal places, or several
+             temperatures for one reflectance file each (_AUTOSPEC_reflectance_#K)
+    --clouds:  cloud altitudes in km, or cloud decks TOP:BOTTOM[:OPACITY] (optional)
+    --cloud-grid:  also a cloud at every altitude from START to STOP (included) in steps of STEP km (optional)
+    --outdir:  directory for the AUTOSPEC files (optional, default is next to each LAYERS file)
+    --coarsen:  merge adjacent layers whose mixing ratios and temperature are within this
+                relative tolerance, e.g. 0.05, the merged LAYERS file is written with the files,
+                which are named after it (optional, see coarsen_layers.py)
+    --prune:  drop molecules whose mixing ratio is below THRESHOLD in every layer (or whose
+              column-weighted mean is, with column:THRESHOLD), and write a report of them
+              next to the AUTOSPEC files (optional, see prune_species.py)
+    --jobs:  number of worker processes (optional, default 1)
+    --cache:  directory to cache parsed LAYERS and chem files in (optional)
+    --cache-size:  maximum size of the cache in MB (optional, default 1000)
+    --build:  JSON build manifest, only outdated AUTOSPEC files are created (optional)
+    --archive:  write all AUTOSPEC files into one .tar, .tar.gz, .tar.xz or .zip archive (optional)
+    --journal:  file to record every finished job in, running the same command again skips
+                the jobs already done (optional, see journal_AUTOSPEC.py, not with --archive)
+    --skip-failed:  don't run the jobs that failed in the journal (or queue) again (optional)
+    --queue:  add the jobs to a queue directory instead of running them, for workers on any
+              number of nodes to run (optional, see queue_AUTOSPEC.py, not with --build,
+              --archive or --journal)
+    --quiet:  only print warnings and errors (optional)
+    --verbose:  also print every molecule and stage time (optional)
+    --timing:  file to write a JSON summary of the stage times to (optional)
+
+Pairing LAYERS and chem files:
+    If the LAYERS and chem arguments both contain {}, {} matches the model name, e.g.
+        'layers/LAYERS.atmZL_altPT_{}.txt' --chem 'chem/chem_{}'
+    If --chem is a single file it is used with every LAYERS file.
+    Otherwise the LAYERS and chem files are paired in sorted order.
+
+The main(argv) function can also be called from Python, and returns the exit status.
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+
+import numpy as np
+
+
+def read_mollist(filename):
+
+    # Molecule names separated by spaces or new lines, # starts a comment
+    mollist = []
+    with open(filename) as f:
+        for row in f:
+            mollist.extend(row.split('#')[0].split())
+
+    return mollist
+
+
+def pair_files(layers,chem):
+
+    # Pairing patterns with {} for the model name
+    if len(layers) == 1 and '{}' in layers[0] and '{}' in chem:
+        pre,post = layers[0].split('{}',1)
+        match = re.compile(re.escape(pre)+'(.*)'+re.escape(post)+'$')
+        pairs = []
+        for lfile in sorted(glob.glob(layers[0].replace('{}','*',1))):
+            name = match.match(lfile).group(1)
+            pairs.append((lfile,chem.replace('{}',name)))
+        return pairs
+
+    lfiles = []
+    for pattern in layers:
+        lfiles.extend(sorted(glob.glob(pattern)) or [pattern])
+
+    # A single chem file for every LAYERS file
+    cfiles = sorted(glob.glob(chem)) or [chem]
+    if len(cfiles) == 1:
+        return [(lfile,cfiles[0]) for lfile in lfiles]
+
+    if len(cfiles) != len(lfiles):
+        raise ValueError(str(len(lfiles))+' LAYERS files but '+str(len(cfiles))+' chem files')
+
+    return list(zip(lfiles,cfiles))
+
+
+def cloud_grid(start,stop,step):
+
+    # Rounded, so the altitudes in the file names are e.g. 1.2 rather than 1.2000000000000002
+    n = int(np.floor((stop-start)/step+1e-9))+1
+    return np.round(start+step*np.arange(n),6).tolist()
+
+
+def main(argv=None):
+
+    # Code to run make_AUTOSPEC for many models in parallel
+    from sweep_AUTOSPEC import sweep_AUTOSPEC
+    # Code to cache parsed input files
+    from cache_inputs import InputCache
+    # Code to set up logging
+    from timing_AUTOSPEC import setup_logging
+    # Code to read cloud decks
+    from render_AUTOSPEC import parse_cloud
+    # Code to read the pruning threshold
+    from prune_species import prune_rule
+    # Code to share jobs between nodes
+    from queue_AUTOSPEC import JobQueue
+
+    parser = argparse.ArgumentParser(description='Create reflectance and emission AUTOSPEC files')
+    parser.add_argument('layers',nargs='+',help='LAYERS files, globs or a pattern with {}')
+    parser.add_argument('--chem',required=True,help='chem file, glob or a pattern with {}')
+    parser.add_argument('--molecules',required=True,help='file with the molecule list')
+    parser.add_argument('--temp',required=True,nargs='+',help='stellar host temperatures, e.g. 4286.00')
+    parser.add_argument('--clouds',nargs='*',type=parse_cloud,default=[],
+                        help='cloud altitudes (km) or decks TOP:BOTTOM[:OPACITY]')
+    parser.add_argument('--cloud-grid',nargs=3,type=float,default=None,metavar=('START','STOP','STEP'),
+                        help='grid of cloud altitudes (km)')
+    parser.add_argument('--outdir',default=None,help='directory for the AUTOSPEC files')
+    parser.add_argument('--coarsen',type=float,default=None,metavar='TOL',
+                        help='merge adjacent layers within this relative tolerance, e.g. 0.05')
+    parser.add_argument('--prune',type=prune_rule,default=None,metavar='[column:]THRESHOLD',
+                        help='drop molecules below THRESHOLD in every layer (or in column), e.g. 1e-12')
+    parser.add_argument('--jobs','-j',type=int,default=1,help='number of worker processes')
+    parser.add_argument('--cache',default=None,help='directory to cache parsed input files in')
+    parser.add_argument('--cache-size',type=float,default=1000,help='maximum cache size (MB)')
+    parser.add_argument('--build',default=None,help='build manifest to skip up to date files')
+    parser.add_argument('--archive',default=None,help='archive to write all AUTOSPEC files into')
+    parser.add_argument('--journal',default=None,help='journal of finished jobs, to resume a sweep')
+    parser.add_argument('--skip-failed',action='store_true',help='don\'t run jobs that failed in the journal again')
+    parser.add_argument('--queue',default=None,help='queue directory to add the jobs to instead of running them')
+    parser.add_argument('--quiet','-q',action='store_true',help='only print warnings and errors')
+    parser.add_argument('--verbose','-v',action='store_true',help='print every molecule and stage')
+    parser.add_argument('--timing',default=None,help='JSON file for the stage time summary')
+    args = parser.parse_args(argv)
+    if args.journal is not None and args.archive is not None:
+        parser.error('--journal can\'t be used with --archive')
+    if args.queue is not None and (args.build is not None or args.archive is not None or args.journal is not None):
+        parser.error('--queue can\'t be used with --build, --archive or --journal')
+
+    setup_logging(args.quiet,args.verbose)
+
+    mollist = read_mollist(args.molecules)
+
+    # A single temperature keeps the _AUTOSPEC_reflectance file name
+    temp = args.temp
+    if len(temp) == 1:
+        temp = temp[0]
+
+    clist = list(args.clouds)
+    if args.cloud_grid is not None:
+        clist.extend(cloud_grid(*args.cloud_grid))
+    try:
+        pairs = pair_files(args.layers,args.chem)
+    except ValueError as err:
+        parser.error(str(err))
+
+    if args.outdir is not None:
+        os.makedirs(args.outdir,exist_ok=True)
+
+    jobs = []
+    for lfile,cfile in pairs:
+        jobs.append({'layersfile': lfile,'chemfile': cfile,'temp': temp,
+                     'clist': clist,'mollist': mollist,'outdir': args.outdir,'coarsen': args.coarsen,
+                     'prune': args.prune})
+
+    # Workers on any node run the jobs from the queue (python queue_AUTOSPEC.py work QUEUE)
+    if args.queue is not None:
+        JobQueue(args.queue).submit(jobs,args.skip_failed)
+        return 0
+
+    cache = None
+    if args.cache is not None:
+        cache = InputCache(args.cache,args.cache_size*1e6)
+
+    failed = sweep_AUTOSPEC(jobs,args.jobs,cache,args.timing,build=args.build,archive=args.archive,
+                            journal=args.journal,retry_failed=not args.skip_failed)
+
+    return 1 if len(failed) != 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to run a long-lived AUTOSPEC service that keeps parsed inputs in memory and answers
+requests for AUTOSPEC files, over a Unix socket or stdin/stdout:
+    python serve_AUTOSPEC.py --socket PATH [--max-memory MB] [--quiet | --verbose]
+    python serve_AUTOSPEC.py --stdio [--max-memory MB] [--quiet | --verbose]
+
+Inputs:
+    --socket:  path of the Unix socket to listen on
+    --stdio:  read requests from stdin and write responses to stdout instead
+    --max-memory:  memory for parsed inputs and formatted molecules in MB (optional, default 1000)
+
+Requests and responses are JSON objects, one per line. A request for AUTOSPEC files:
+    {"id": 1, "layersfile": PATH, "chemfile": PATH, "mollist": [...], "temp": "4286.00",
+     "clist": [1.0, 6.0], "outdir": DIR, "write": true, "coarsen": null, "prune": null}
+
+    temp, clist, coarsen and prune are as for make_AUTOSPEC (decks in clist as lists). With "write": true
+    (default) the files are written (to outdir, default next to the LAYERS file) and the
+    response lists their paths, otherwise the response has the text of every file:
+    {"id": 1, "ok": true, "paths": [...]}  or  {"id": 1, "ok": true, "files": {variant: text}}
+    With prune, the response also has "pruned", the molecules dropped (and the pruning report
+    is written with the files). With coarsen, the files are named after the merged LAYERS
+    file as for make_AUTOSPEC, and "layers" is its path (written with the files) or its text.
+
+Other requests:
+    {"op": "ping"}:  {"ok": true}
+    {"op": "stats"}:  number of requests, entries and memory used by the cache, hits and misses
+    {"op": "shutdown"}:  stops the service
+Failed requests get {"ok": false, "error": message}.
+
+Parsed LAYERS files, chem files and renderers (formatted molecule blocks for one LAYERS
+file, chem file and molecule list) are kept in a least recently used cache, keyed by the
+path, size and modification time of the files, so a changed file is parsed again. A
+request for a model that is already cached only renders and writes its files. See
+client_AUTOSPEC.py for a client.
+"""
+
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+
+import numpy as np
+
+from build_AUTOSPEC import output_files
+from coarsen_layers import coarse_name, coarsen_layers
+from prune_species import prune_report, prune_rule, report_path
+from read_chem_files import ChemFile, load_chem_file
+from read_LAYERS import LayersFile, load_layers_file
+from render_AUTOSPEC import AUTOSPECRenderer, as_clouds, render_files
+from sinks_AUTOSPEC import DirectorySink
+from timing_AUTOSPEC import TIMER, logger, setup_logging
+
+
+def sizeof(obj):
+
+    # Approximate memory used by a cached object (bytes)
+    if isinstance(obj,LayersFile):
+        return sum([vals.nbytes for vals in obj.blocks.values()])
+    if isinstance(obj,ChemFile):
+        size = sum([alt.nbytes+mr.nbytes for alt,mr in obj.species.values()])
+        # Decompressed chem files are held in memory (memory maps aren't counted)
+        if isinstance(getattr(obj,'mm',None),bytes):
+            size = size+len(obj.mm)
+        return size
+    if isinstance(obj,AUTOSPECRenderer):
+        size = len(obj.body_emission)+len(obj.body_reflectance)+sum([len(row) for row in obj.cont_rows])
+        size = size+np.asarray(obj.mrs).nbytes
+        if obj.reflectance_tail is not None:
+            size = size+len(obj.reflectance_tail)
+        return size
+    return 0
+
+
+class WarmCache:
+
+    def __init__(self,maxsize=1e9):
+
+        self.maxsize = maxsize
+        # Key -> object, least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self,key,make):
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        obj = make()
+        self.entries[key] = obj
+        self.evict()
+
+        return obj
+
+
+    def size(self):
+
+        # Sizes change as chem files parse more molecules, so they are measured each time
+        return sum([sizeof(obj) for obj in self.entries.values()])
+
+
+    def evict(self):
+
+        # Remove the least recently used entries until the cache fits in maxsize, the
+        # newest entry is always kept
+        total = self.size()
+        while total > self.maxsize and len(self.entries) > 1:
+            key,obj = self.entries.popitem(last=False)
+            total = total-sizeof(obj)
+            if hasattr(obj,'close'):
+                obj.close()
+            logger.debug('Evicted %s',key)
+
+
+class AUTOSPECService:
+
+    def __init__(self,maxsize=1e9):
+
+        self.cache = WarmCache(maxsize)
+        self.requests = 0
+        # Requests from several connections are answered one at a time
+        self.lock = threading.Lock()
+
+
+    def file_key(self,kind,filename):
+
+        st = os.stat(filename)
+        return (kind,os.path.abspath(filename),st.st_size,st.st_mtime_ns)
+
+
+    def renderer(self,layersfile,chemfile,mollist,coarsen=None,clist=(),prune=None):
+
+        lkey = self.file_key('layers',layersfile)
+        ckey = self.file_key('chem',chemfile)
+
+        def make():
+            lay = self.cache.get(lkey,lambda: load_layers_file(layersfile))
+            chem = self.cache.get(ckey,lambda: load_chem_file(chemfile))
+            if coarsen is not None:
+                lay,chem,groups = coarsen_layers(lay,chem,mollist,coarsen,clist)
+            return AUTOSPECRenderer(lay,chem,mollist,prune=prune)
+
+        # Coarsened layers also depend on the clouds
+        key = ('render',lkey,ckey,tuple(mollist))
+        if coarsen is not None:
+            key = key+(coarsen,tuple(clist))
+        if prune is not None:
+            key = key+(str(prune),)
+        return self.cache.get(key,make)
+
+
+    def generate(self,req):
+
+        layersfile = req['layersfile']
+        temp = req['temp']
+        # Cloud decks come as lists (or TOP:BOTTOM[:OPACITY] text)
+        clist = as_clouds(req.get('clist',[]))
+
+        prune = prune_rule(req.get('prune'))
+        coarsen = req.get('coarsen')
+        render = self.renderer(layersfile,req['chemfile'],req['mollist'],coarsen,clist,prune)
+        files = output_files(layersfile,clist,req.get('outdir'),temp,coarsen)
+
+        resp = {}
+        if prune is not None:
+            resp['pruned'] = render.pruned
+
+        if req.get('write',True):
+            sink = DirectorySink(req.get('outdir'))
+            # Same merged LAYERS file and report as make_AUTOSPEC
+            if coarsen is not None:
+                resp['layers'] = sink.write(coarse_name(layersfile,coarsen,req.get('outdir')),render.lay.text())
+            resp['paths'] = [sink.write(path,text) for path,text in render_files(render,files,temp)]
+            if prune is not None:
+                sink.write(report_path(render.lay.filename,req.get('outdir')),prune_report(render,req['mollist'],prune))
+            return resp
+
+        if coarsen is not None:
+            resp['layers'] = render.lay.text()
+
+        texts = {}
+        for path,text in render_files(render,files,temp):
+            if not isinstance(text,str):
+                text = ''.join(text)
+            texts[path.rsplit('_AUTOSPEC_',1)[1]] = text
+        resp['files'] = texts
+        return resp
+
+
+    def handle(self,req):
+
+        # Answer one request, errors are returned rather than raised
+        with self.lock:
+            self.requests += 1
+            # Stage times of a request aren't kept, so they don't grow with every request
+            start = len(TIMER.records)
+            resp = {'id': req.get('id'),'ok': True}
+            op = req.get('op','generate')
+            try:
+                if op == 'generate':
+                    resp.update(self.generate(req))
+                    # Renderers grow as they are used (e.g. the reflectance tail)
+                    self.cache.evict()
+                elif op == 'stats':
+                    resp.update({'requests': self.requests,'entries': len(self.cache.entries),
+                                 'memory': self.cache.size(),'max_memory': self.cache.maxsize,
+                                 'hits': self.cache.hits,'misses': self.cache.misses})
+                elif op not in ('ping','shutdown'):
+                    raise ValueError('Unknown op '+repr(op))
+            except Exception as err:
+                logger.debug(traceback.format_exc())
+                resp = {'id': req.get('id'),'ok': False,'error': type(err).__name__+': '+str(err)}
+            finally:
+                del TIMER.records[start:]
+
+        return resp
+
+
+    def handle_line(self,line):
+
+        # One JSON line in, one JSON line out
+        try:
+            req = json.loads(line)
+        except ValueError as err:
+            return {'ok': False,'error': 'Bad JSON: '+str(err)},False
+        return self.handle(req),req.get('op') == 'shutdown'
+
+
+def serve_stdio(service,fin=sys.stdin,fout=sys.stdout):
+
+    # Logs go to stderr, stdout only has the responses
+    for line in fin:
+        if len(line.strip()) == 0:
+            continue
+        resp,stop = service.handle_line(line)
+        fout.write(json.dumps(resp)+'\n')
+        fout.flush()
+        if stop:
+            break
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+
+        # Requests on one connection are answered in order until the client disconnects
+        for line in self.rfile:
+            if len(line.strip()) == 0:
+                continue
+            resp,stop = self.server.service.handle_line(line)
+            self.wfile.write((json.dumps(resp)+'\n').encode())
+            self.wfile.flush()
+            if stop:
+                threading.Thread(target=self.server.shutdown).start()
+                break
+
+
+class AUTOSPECServer(socketserver.ThreadingMixIn,socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+
+def serve_socket(service,path):
+
+    # Remove a socket left by a previous run
+    if os.path.exists(path):
+        os.remove(path)
+
+    with AUTOSPECServer(path,RequestHandler) as server:
+        server.service = service
+        logger.info('AUTOSPEC service listening on %s',path)
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Long-lived AUTOSPEC service')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--socket',default=None,help='Unix socket to listen on')
+    mode.add_argument('--stdio',action='store_true',help='JSON lines on stdin and stdout')
+    parser.add_argument('--max-memory',type=float,default=1000,help='cache memory (MB)')
+    parser.add_argument('--quiet','-q',action='store_true',help='only print warnings and errors')
+    parser.add_argument('--verbose','-v',action='store_true',help='print every molecule and stage')
+    args = parser.parse_args(argv)
+
+    setup_logging(args.quiet,args.verbose)
+    service = AUTOSPECService(args.max_memory*1e6)
+
+    if args.stdio:
+        serve_stdio(service)
+    else:
+        serve_socket(service,args.socket)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to parse each LAYERS and chem file of a sweep once and share the parsed data with every
+job (and every worker process) that uses it:
+    inputs = group_inputs(jobs)
+    key,data,err,records = parse_input(key,mollist,cache)
+    shared = SharedInputs(parsed)
+    lay = shared.get(('layers',layersfile))
+    chem = shared.get(('chem',chemfile))
+
+Inputs:
+    jobs:  list of jobs from read_manifest (dicts with layersfile, chemfile and mollist)
+    key:  ('layers',filename) or ('chem',filename)
+    mollist:  molecules needed from a chem file (all molecules of the jobs that use it)
+    cache:  InputCache to parse the file with (optional)
+    parsed:  dict of key -> data from parse_input
+
+Outputs:
+    group_inputs:  dict of key -> set of molecules needed (empty for LAYERS files)
+    parse_input:  the parsed data (arrays only), or the error message
+    SharedInputs.get:  a LayersFile or ChemFile built on the shared arrays
+
+The arrays of all parsed files are copied once into one block of shared memory. Worker
+processes attach to it with attach_inputs (as the pool initializer) and get their
+LayersFile and ChemFile objects from shared_input(key) without copying the arrays.
+"""
+
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from read_chem_files import ChemFile, load_chem_file
+from read_LAYERS import LayersFile, load_layers_file
+from timing_AUTOSPEC import TIMER
+
+
+def group_inputs(jobs):
+
+    inputs = {}
+    for job in jobs:
+        inputs.setdefault(('layers',job['layersfile']),set())
+        inputs.setdefault(('chem',job['chemfile']),set()).update(job['mollist'])
+
+    return inputs
+
+
+def parse_input(key,mollist,cache=None):
+
+    # Stage times are returned, so they reach the main process from workers
+    start = len(TIMER.records)
+
+    kind,filename = key
+    data = None
+    err = None
+    try:
+        with TIMER.recording():
+            if kind == 'layers':
+                lay = load_layers_file(filename,cache)
+                data = {'n': lay.n,'blocks': lay.blocks}
+            else:
+                # Only the molecules that some job needs
+                chem = load_chem_file(filename,cache)
+                data = {'species': {}}
+                for name in mollist:
+                    if name in chem:
+                        data['species'][name] = chem.lookup(name)
+    except Exception:
+        err = traceback.format_exc()
+
+    records = TIMER.records[start:]
+    del TIMER.records[start:]
+
+    return key,data,err,records
+
+
+def build_input(key,data):
+
+    kind,filename = key
+    if kind == 'layers':
+        return LayersFile(filename,data['blocks'],data['n'])
+    return ChemFile(filename,data['species'])
+
+
+class SharedInputs:
+
+    def __init__(self,parsed):
+
+        # Layout of every array in the shared block: key -> (n, [(label, offset, length)])
+        # for LAYERS files, or key -> [(name, alt offset, alt length, mr offset, mr length)]
+        # for chem files
+        self.table = {}
+        arrays = []
+        size = 0
+        for key in parsed:
+            data = parsed[key]
+            if key[0] == 'layers':
+                blocks = []
+                for label in data['blocks']:
+                    arr = data['blocks'][label]
+                    blocks.append((label,size,len(arr)))
+                    arrays.append(arr)
+                    size = size+len(arr)
+                self.table[key] = (data['n'],blocks)
+            else:
+                species = []
+                for name in data['species']:
+                    alt,mr = data['species'][name]
+                    species.append((name,size,len(alt),size+len(alt),len(mr)))
+                    arrays.extend([alt,mr])
+                    size = size+len(alt)+len(mr)
+                self.table[key] = species
+
+        self.shm = shared_memory.SharedMemory(create=True,size=max(size,1)*8)
+        self.name = self.shm.name
+        buf = np.ndarray((size,),dtype=float,buffer=self.shm.buf)
+        pos = 0
+        for arr in arrays:
+            buf[pos:pos+len(arr)] = arr
+            pos = pos+len(arr)
+        del buf
+
+        self.objects = {}
+
+
+    def get(self,key):
+
+        if key not in self.objects:
+            self.objects[key] = view_input(self.shm,key,self.table[key])
+        return self.objects[key]
+
+
+    def close(self):
+
+        self.objects = {}
+        self.shm.close()
+        self.shm.unlink()
+
+
+def view_input(shm,key,layout):
+
+    # Build a LayersFile or ChemFile on read-only views of the shared block
+    buf = np.ndarray((shm.size//8,),dtype=float,buffer=shm.buf)
+    buf.flags.writeable = False
+
+    if key[0] == 'layers':
+        n,blocks = layout
+        data = {'n': n,'blocks': {}}
+        for label,off,length in blocks:
+            data['blocks'][label] = buf[off:off+length]
+    else:
+        data = {'species': {}}
+        for name,aoff,alen,moff,mlen in layout:
+            data['species'][name] = (buf[aoff:aoff+alen],buf[moff:moff+mlen])
+
+    return build_input(key,data)
+
+
+# Shared block and objects of this worker process, set by attach_inputs
+WORKER = {}
+
+
+def attach_inputs(name,table):
+
+    WORKER['shm'] = shared_memory.SharedMemory(name=name)
+    WORKER['table'] = table
+    WORKER['objects'] = {}
+
+
+def shared_input(key):
+
+    # Returns None if the worker isn't attached or the file isn't shared
+    if 'shm' not in WORKER or key not in WORKER['table']:
+        return None
+    if key not in WORKER['objects']:
+        WORKER['objects'][key] = view_input(WORKER['shm'],key,WORKER['table'][key])
+    return WORKER['objects'][key]
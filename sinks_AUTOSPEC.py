@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to send AUTOSPEC files made by make_AUTOSPEC somewhere other than next to the LAYERS file:
+    make_AUTOSPEC(layersfile,chemfile,mollist,temp,clist,sink=sink)
+
+Sinks:
+    DirectorySink(outdir):  writes each file (to outdir if given, otherwise to its default path)
+    MemorySink():  keeps the text of each file in sink.files, path -> text, without writing
+
+A sink is any object with a write(path,text) method, where path is the default path of the
+AUTOSPEC file and text is a string or a list of strings (parts of the file). write returns
+the path of the file it wrote on disk, or None if it didn't write one (only files written on
+disk are recorded in a build manifest).
+"""
+
+import os
+
+from render_AUTOSPEC import write_AUTOSPEC
+
+
+class DirectorySink:
+
+    def __init__(self,outdir=None):
+
+        self.outdir = outdir
+        if outdir is not None:
+            os.makedirs(outdir,exist_ok=True)
+
+
+    def write(self,path,text):
+
+        if self.outdir is not None:
+            path = os.path.join(self.outdir,os.path.basename(path))
+        write_AUTOSPEC(path,text)
+
+        return path
+
+
+class MemorySink:
+
+    def __init__(self):
+
+        self.files = {}
+
+
+    def write(self,path,text):
+
+        if not isinstance(text,str):
+            text = ''.join(text)
+        self.files[path] = text
+
+        return None
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to create AUTOSPEC files for many LAYERS/chem file pairs listed in a manifest, in parallel:
+    sweep_AUTOSPEC(manifest,workers)
+
+Inputs: manifest, number of worker processes
+    manifest:  path to a CSV or JSON manifest as a string (or a list of jobs from read_manifest)
+    workers:  number of worker processes (optional, default is the number of cores)
+    cache:  InputCache shared by all jobs to skip parsing files again (optional)
+    timing:  path to write a JSON summary of the stage times to (optional)
+    group:  if True, parse each LAYERS and chem file once for all the jobs that use it, and
+            pass the parsed arrays to worker processes through shared memory (optional, default True)
+    build:  build manifest (path or BuildManifest), only models with outdated AUTOSPEC files
+            are run and the manifest is saved at the end (optional)
+    archive:  archive (path or ArchiveSink) to write all AUTOSPEC files into instead of
+              writing them one by one (optional, see archive_AUTOSPEC.py)
+    journal:  journal (path or SweepJournal) of the jobs done and failed, jobs already done
+              in it are skipped, so a sweep that stopped part way carries on where it stopped
+              when it is run again (optional, see journal_AUTOSPEC.py, not with archive)
+    retry_failed:  if False, jobs that failed in the journal aren't run again (optional,
+                   default True)
+
+Outputs: list of failed jobs
+    Each failure is (job, error message). A failing job doesn't stop the others, not even one
+    that kills its worker process.
+    Progress and a summary are logged to the 'AUTOSPEC' logger (see timing_AUTOSPEC.py).
+
+Manifest format, one row per model:
+    CSV:  columns layersfile, chemfile, temp, clist, mollist (and optionally outdir, coarsen,
+          the tolerance to merge layers with, see coarsen_layers.py, and prune, the threshold
+          to drop negligible molecules with, e.g. 1e-12 or column:1e-12, see prune_species.py)
+          clist and mollist are separated by spaces, e.g. "1.0 6.0 12.0" and "H2O CO2 O3"
+          cloud decks in clist are written TOP:BOTTOM[:OPACITY], e.g. "1.0 12.0:6.0"
+          temp can be several temperatures separated by spaces (one reflectance file each)
+    JSON:  list of objects with the same keys, clist and mollist as lists (decks as lists)
+    Relative paths are relative to the directory of the manifest.
+"""
+
+import csv
+import json
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from archive_AUTOSPEC import ArchiveSink
+from build_AUTOSPEC import BuildManifest, output_files
+from journal_AUTOSPEC import SweepJournal
+from render_AUTOSPEC import as_clouds
+from sinks_AUTOSPEC import MemorySink
+from share_inputs import SharedInputs, attach_inputs, build_input, group_inputs, parse_input, shared_input
+from timing_AUTOSPEC import TIMER, logger
+
+
+def read_manifest(filename):
+
+    with open(filename) as f:
+        if filename.endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+
+    mdir = os.path.dirname(os.path.abspath(filename))
+
+    jobs = []
+    for row in rows:
+        job = {}
+        for key in ('layersfile','chemfile'):
+            job[key] = os.path.join(mdir,row[key])
+
+        # Stellar temperature as a string with two decimal places, or a list of them
+        # (separated by spaces in CSV)
+        temp = row['temp']
+        if isinstance(temp,str) and len(temp.split()) > 1:
+            temp = temp.split()
+        if isinstance(temp,list):
+            temp = [t if isinstance(t,str) else '%.2f' % t for t in temp]
+        elif not isinstance(temp,str):
+            temp = '%.2f' % temp
+        job['temp'] = temp
+
+        clist = row.get('clist',[])
+        mollist = row['mollist']
+        if isinstance(clist,str):
+            clist = clist.split()
+        if isinstance(mollist,str):
+            mollist = mollist.split()
+        # Cloud altitudes, or decks as TOP:BOTTOM[:OPACITY] (CSV) or lists (JSON)
+        job['clist'] = as_clouds(clist)
+        job['mollist'] = list(mollist)
+
+        # Output directory, default is next to the LAYERS file
+        job['outdir'] = None
+        if row.get('outdir'):
+            job['outdir'] = os.path.join(mdir,row['outdir'])
+
+        # Tolerance to merge layers with, default keeps every layer
+        job['coarsen'] = None
+        if row.get('coarsen') not in (None,''):
+            job['coarsen'] = float(row['coarsen'])
+
+        # Threshold to drop negligible molecules with, default keeps every molecule
+        job['prune'] = None
+        if row.get('prune') not in (None,''):
+            job['prune'] = str(row['prune'])
+
+        jobs.append(job)
+
+    return jobs
+
+
+def run_job(job):
+
+    # Code to create both reflectance and emission AUTOSPEC files
+    from make_AUTOSPEC import make_AUTOSPEC
+
+    # Stage times of this job are returned, so they reach the main process from workers
+    start = len(TIMER.records)
+
+    # Inputs parsed once for the whole sweep, either passed in the job or shared with
+    # this worker process
+    layersfile = job['layersfile']
+    chemfile = job['chemfile']
+    if 'inputs' in job:
+        layersfile,chemfile = job['inputs']
+    else:
+        lay = shared_input(('layers',layersfile))
+        chem = shared_input(('chem',chemfile))
+        if lay is not None and chem is not None:
+            layersfile,chemfile = lay,chem
+
+    # Files going into an archive are returned to the main process, which writes the archive
+    sink = None
+    if job.get('collect'):
+        sink = MemorySink()
+
+    # Errors are returned rather than raised so one bad model doesn't stop the sweep
+    err = None
+    try:
+        with TIMER.recording():
+            make_AUTOSPEC(layersfile,chemfile,job['mollist'],job['temp'],job['clist'],
+                          job.get('outdir'),job.get('cache'),job.get('build'),sink,job.get('coarsen'),
+                          job.get('prune'))
+    except Exception:
+        err = traceback.format_exc()
+
+    if sink is not None:
+        job['files'] = list(sink.files.items())
+
+    records = TIMER.records[start:]
+    del TIMER.records[start:]
+
+    return job,err,records
+
+
+def add_files(sink,job):
+
+    # Write the files of a job into the archive
+    if sink is None:
+        return
+    for path,text in job.pop('files',[]):
+        sink.write(path,text)
+
+
+def run_pool(jobs,workers,initializer,initargs,done):
+
+    # Run jobs in a process pool, done(job,err,records) is called as each job finishes.
+    # A worker that dies breaks the pool and every job still running in it, so only as many
+    # jobs are sent to the pool as there are workers. If the pool breaks, the jobs that were
+    # running (one of them killed its worker) and the jobs not sent yet are returned
+    jobs = list(jobs)
+    running = {}
+    broken = []
+
+    def collect(futs):
+        for fut in futs:
+            job = running.pop(fut)
+            try:
+                result = fut.result()
+            except BrokenProcessPool:
+                broken.append(job)
+                continue
+            except Exception:
+                result = job,traceback.format_exc(),[]
+            done(*result)
+
+    with ProcessPoolExecutor(max_workers=workers,initializer=initializer,initargs=initargs) as pool:
+        while len(jobs) != 0 or len(running) != 0:
+            while len(jobs) != 0 and len(running) < workers:
+                try:
+                    fut = pool.submit(run_job,jobs[0])
+                except BrokenProcessPool:
+                    break
+                running[fut] = jobs.pop(0)
+            if len(running) == 0:
+                break
+            collect(wait(running,return_when=FIRST_COMPLETED)[0])
+            # Every job still running fails with the pool
+            if len(broken) != 0:
+                collect(wait(running)[0])
+                break
+
+    return broken,jobs
+
+
+def parse_inputs(jobs,workers,cache):
+
+    # Parse every LAYERS and chem file once, in parallel
+    needed = group_inputs(jobs)
+    keys = list(needed)
+    mollists = [sorted(needed[key]) for key in keys]
+
+    if workers == 1:
+        results = map(parse_input,keys,mollists,[cache]*len(keys))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(parse_input,keys,mollists,[cache]*len(keys)))
+
+    parsed = {}
+    errors = {}
+    for key,data,err,records in results:
+        TIMER.add(records)
+        if err is None:
+            parsed[key] = data
+        else:
+            errors[key] = err
+
+    logger.info('Parsed %d input files for %d models',len(parsed),len(jobs))
+
+    return parsed,errors
+
+
+def sweep_AUTOSPEC(manifest,workers=None,cache=None,timing=None,group=True,build=None,archive=None,
+                   journal=None,retry_failed=True):
+
+    if isinstance(manifest,str):
+        jobs = read_manifest(manifest)
+    else:
+        jobs = list(manifest)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if cache is not None:
+        jobs = [dict(job,cache=cache) for job in jobs]
+
+    # All files go into one archive instead of their own files
+    sink = None
+    if archive is not None:
+        jobs = [dict(job,collect=True) for job in jobs]
+        sink = archive
+        if isinstance(archive,str):
+            sink = ArchiveSink(archive)
+
+    # Skip the jobs already done in the journal
+    opened = False
+    if journal is not None:
+        if archive is not None:
+            raise ValueError('A journal can\'t be used with an archive, which is only kept if the whole sweep runs')
+        if isinstance(journal,str):
+            journal = SweepJournal(journal)
+            opened = True
+        jobs = journal.remaining(jobs,retry_failed)
+
+    # Stage times are only recorded for the timing summary (or if the caller records them)
+    start = len(TIMER.records)
+    with TIMER.recording(timing is not None):
+        failed = []
+        t0 = time.perf_counter()
+
+        def finish(job,err):
+            # Failed jobs are kept, and every finished job is recorded in the journal
+            if err is not None:
+                failed.append((job,err))
+            if journal is not None:
+                journal.record(job,err)
+
+        # Only run the models with outdated AUTOSPEC files, each job gets a small build
+        # manifest with its own input hashes and returns it with the files it created
+        if build is not None:
+            if isinstance(build,str):
+                build = BuildManifest(build)
+            todo = []
+            for job in jobs:
+                try:
+                    stale = build.stale_outputs(job['layersfile'],job['chemfile'],job['mollist'],
+                                                job['temp'],job['clist'],job.get('outdir'),job.get('coarsen'),
+                                                job.get('prune'))
+                except Exception:
+                    finish(job,traceback.format_exc())
+                    continue
+                if len(stale) != 0:
+                    outputs = output_files(job['layersfile'],job['clist'],job.get('outdir'),job['temp'],job.get('coarsen'))
+                    sub = build.subset(job['layersfile'],job['chemfile'],[path for variant,calt,path in outputs])
+                    todo.append(dict(job,build=sub))
+            logger.info('%d of %d models are up to date',len(jobs)-len(todo)-len(failed),len(jobs))
+            run = todo
+        else:
+            run = jobs
+
+        # Parse each shared input once for all the jobs that use it
+        shared = None
+        if group:
+            parsed,errors = parse_inputs(run,workers,cache)
+
+            # Jobs with an input that can't be parsed fail without running
+            ready = []
+            for job in run:
+                lkey = ('layers',job['layersfile'])
+                ckey = ('chem',job['chemfile'])
+                if lkey in errors or ckey in errors:
+                    finish(job,errors.get(lkey) or errors.get(ckey))
+                else:
+                    ready.append(job)
+            jobs_run = ready
+
+            if workers == 1:
+                objects = {key: build_input(key,parsed[key]) for key in parsed}
+                jobs_run = [dict(job,inputs=(objects[('layers',job['layersfile'])],
+                                             objects[('chem',job['chemfile'])])) for job in ready]
+            else:
+                # Workers get the parsed arrays through shared memory
+                shared = SharedInputs(parsed)
+        else:
+            jobs_run = run
+
+        def done(job,err,records):
+            # Stage times, build manifest and archive files of a finished job (a file the
+            # archive can't take stops the sweep)
+            TIMER.add(records)
+            if build is not None:
+                build.merge(job['build'])
+            add_files(sink,job)
+            finish(job,err)
+
+        try:
+            # Run in this process when there is only one worker
+            if workers == 1:
+                for job in jobs_run:
+                    done(*run_job(job))
+            else:
+                initargs = ()
+                initializer = None
+                if shared is not None:
+                    initializer = attach_inputs
+                    initargs = (shared.name,shared.table)
+                # A worker that dies (killed, or out of memory) breaks the pool and the jobs
+                # running in it. Each of those jobs is run again in a pool of its own, so only
+                # the job that kills its worker again fails, and the rest go on in a new pool
+                pending = jobs_run
+                while len(pending) != 0:
+                    broken,pending = run_pool(pending,workers,initializer,initargs,done)
+                    for job in broken:
+                        if len(run_pool([job],1,initializer,initargs,done)[0]) != 0:
+                            done(job,'Worker process died while running this job (killed, or out of memory?)\n',[])
+        except BaseException:
+            # An archive is only kept if the whole sweep ran
+            if sink is not None and isinstance(archive,str):
+                sink.abort()
+            raise
+        finally:
+            if shared is not None:
+                shared.close()
+            # Files created before a failure are kept in the build manifest
+            if build is not None and build.filename is not None:
+                build.save()
+            if opened:
+                journal.close()
+
+        if sink is not None and isinstance(archive,str):
+            sink.close()
+
+        wall = time.perf_counter()-t0
+
+        # Summary of failures
+        logger.info('%d of %d models done, %d failed, %.2f s',len(jobs)-len(failed),len(jobs),len(failed),wall)
+        for job,err in failed:
+            logger.error('Failed: %s %s\n%s',job['layersfile'],job['chemfile'],err)
+
+        # Summary of stage times
+        if timing is not None:
+            TIMER.write_summary(timing,jobs=len(jobs),failed=len(failed),workers=workers,seconds=wall)
+
+    # The records of a timed sweep are only kept if the caller records them
+    if not TIMER.enabled:
+        del TIMER.records[start:]
+
+    return failed
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to log progress and record the wall time of each stage of AUTOSPEC file creation:
+    setup_logging(quiet,verbose)
+    with TIMER.recording():
+        with TIMER.stage(name,filename):
+            (code to time)
+    TIMER.write_summary(filename)
+
+Inputs:
+    quiet:  if True, only log warnings and errors (optional)
+    verbose:  if True, also log every molecule and stage time (optional)
+    name:  name of the stage (parse_layers, parse_chem, interpolate, format, render, write)
+    filename:  file the stage works on (optional)
+
+Outputs:
+    TIMER.records:  list of dicts with stage, file, seconds (and extra information) of the
+                    stages run while the timer is recording
+    TIMER.summary():  dict with the total time and count of each stage, and all records
+    TIMER.write_summary(filename):  the summary as a JSON file
+
+Stages are only recorded inside TIMER.recording() (sweep_AUTOSPEC records them when it writes
+a timing summary), so codes called again and again, e.g. make_AUTOSPEC in a loop, don't keep
+a record of every stage. The stage times are logged either way.
+
+All codes log to the 'AUTOSPEC' logger, which prints nothing until setup_logging (or any
+other logging configuration) is called.
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+
+logger = logging.getLogger('AUTOSPEC')
+
+
+def setup_logging(quiet=False,verbose=False):
+
+    level = logging.INFO
+    if quiet:
+        level = logging.WARNING
+    if verbose:
+        level = logging.DEBUG
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    logger.setLevel(level)
+
+
+class StageTimer:
+
+    def __init__(self):
+
+        self.records = []
+        # Stages are only recorded inside recording()
+        self.enabled = False
+
+
+    @contextmanager
+    def recording(self,on=True):
+
+        # Record the stages run inside the block (off with on=False), as it was afterwards
+        enabled = self.enabled
+        self.enabled = enabled or on
+        try:
+            yield
+        finally:
+            self.enabled = enabled
+
+
+    def add(self,records):
+
+        # Records from another process, kept only while recording
+        if self.enabled:
+            self.records.extend(records)
+
+
+    @contextmanager
+    def stage(self,name,filename=None,**info):
+
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter()-t0
+            if self.enabled:
+                self.records.append(dict(stage=name,file=filename,seconds=dt,**info))
+            logger.debug('%s %s: %.6f s',name,filename,dt)
+
+
+    def totals(self):
+
+        # Total time and count of each stage
+        totals = {}
+        for rec in self.records:
+            if rec['stage'] not in totals:
+                totals[rec['stage']] = {'count': 0,'seconds': 0.0}
+            totals[rec['stage']]['count'] += 1
+            totals[rec['stage']]['seconds'] += rec['seconds']
+
+        return totals
+
+
+    def summary(self):
+
+        return {'stages': self.totals(),'records': self.records}
+
+
+    def write_summary(self,filename,**info):
+
+        with open(filename,'w') as f:
+            json.dump(dict(info,**self.summary()),f,indent=1)
+
+
+    def reset(self):
+
+        self.records = []
+
+
+# Timer shared by all codes in this process
+TIMER = StageTimer()
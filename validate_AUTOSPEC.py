@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code to check AUTOSPEC files before they are run, e.g. a whole sweep at once:
+    report = validate_AUTOSPEC(paths,workers,layers_dir,roundtrip)
+
+    python validate_AUTOSPEC.py PATH [PATH ...] [--layers-dir DIR] [--jobs N] [--roundtrip]
+                                [--json REPORT] [--quiet | --verbose]
+
+Inputs:
+    paths:  AUTOSPEC files, directories and archives (see archive_AUTOSPEC.py)
+    workers:  number of worker processes (optional, default 1)
+    layers_dir:  directory with the LAYERS files the AUTOSPEC files were made from (optional,
+                 default is the directory of the AUTOSPEC files)
+    roundtrip:  also check that every file is written again exactly from its parsed data
+
+Output: dict of AUTOSPEC file -> list of problems, for the files with problems
+
+Every file is checked for:
+    - a header and trailer with every parameter as make_AUTOSPEC writes it
+    - a positive reference temperature (the stellar temperature in the name of the file if it
+      has one, the temperature of the lowest layer of the LAYERS file for emission files)
+    - molecule blocks with the same number of layers as the CONT block and the LAYERS file,
+      distinct names, and flag 1 only on the first molecule
+    - mixing ratios and CONT values from 0 to 1, and 0 in the first layer of reflectance files
+    - the CONT value in the right place: the first layer for reflectance, the last layer for
+      emission, and the layer(s) closest to the cloud in the file name for clouds, with the
+      cloud's opacity
+    - the same molecules and mixing ratios in every file of one LAYERS file
+
+Files are grouped by the LAYERS file they were made from, and each group is checked by one
+worker, which reads the LAYERS file once. The LAYERS checks are skipped (with a warning) if
+the LAYERS file isn't found. The command line exits with 1 if any file has a problem.
+"""
+
+import argparse
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from read_AUTOSPEC import AUTOSPECFile, TEMP_PARAM, iter_sources, parse_variant
+from read_LAYERS import LayersFile
+from render_AUTOSPEC import CONT_ON, HEADER, HEADER_END, TRAILER, cloud_opacity
+from timing_AUTOSPEC import logger, setup_logging
+
+
+# Parameters of a file written by make_AUTOSPEC (the temperature is checked on its own)
+EXPECTED = AUTOSPECFile('expected',HEADER+'0'+HEADER_END+'CONT   0  0.00E+00 \n'+TRAILER).params
+del EXPECTED[TEMP_PARAM]
+
+
+def find_layers(filename,layers_dir=None):
+
+    # LAYERS file an AUTOSPEC file was made from (compressed or not), None if not found
+    base = os.path.basename(filename).split('_AUTOSPEC_',1)[0]
+    if layers_dir is None:
+        layers_dir = os.path.dirname(filename)
+    for ext in ('','.gz','.xz','.bz2'):
+        path = os.path.join(layers_dir,base+ext)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def range_problem(what,names,vals):
+
+    # First value outside 0 to 1 (or not finite), None if there isn't one
+    bad = ~((vals >= 0) & (vals <= 1))
+    if not np.any(bad):
+        return None
+    k = np.argwhere(bad)[0]
+    where = names[k[0]]+' layer '+str(k[1]+1) if vals.ndim == 2 else 'layer '+str(k[0]+1)
+    return '%d %s outside 0 to 1 (first: %s = %s)' % (np.count_nonzero(bad),what,where,vals[tuple(k)])
+
+
+def expected_cont(af,lay):
+
+    # Layers and opacity of the CONT value expected from the file name, layers are None
+    # if they can't be found without the LAYERS file
+    kind,param = parse_variant(af.variant)
+    if kind == 'reflectance':
+        return [0],float(CONT_ON)
+    if kind == 'emission':
+        return [af.nlay-1],float(CONT_ON)
+
+    opacity = float(cloud_opacity(param))
+    if lay is None:
+        return None,opacity
+    # Same layers as the renderer: the closest effective altitude (first of equally close)
+    ealt = lay.ealt
+    if np.ndim(param) == 0:
+        return [int(np.argmin(np.abs(ealt-param)))],opacity
+    i,j = [int(np.argmin(np.abs(ealt-calt))) for calt in param[:2]]
+    return list(range(min(i,j),max(i,j)+1)),opacity
+
+
+def validate_file(af,lay=None,text=None):
+
+    # List of problems of one parsed AUTOSPEC file, lay is its LAYERS file (optional) and
+    # text its original text to check the round trip (optional)
+    problems = []
+
+    for name in EXPECTED:
+        if name not in af.params:
+            problems.append('missing parameter '+repr(name))
+        elif af.params[name] != EXPECTED[name]:
+            problems.append('parameter %r is %r, not %r' % (name,af.params[name],EXPECTED[name]))
+    for name in af.params:
+        if name not in EXPECTED and name != TEMP_PARAM:
+            problems.append('unknown parameter '+repr(name))
+
+    if not (np.isfinite(af.temp) and af.temp > 0):
+        problems.append('reference temperature %s' % af.params[TEMP_PARAM])
+
+    # Molecules
+    if len(af.names) == 0:
+        problems.append('no molecules')
+    if len(set(af.names)) != len(af.names):
+        problems.append('repeated molecules')
+    if any([flag not in ('0','1') for flag in af.flags]) or '1' in af.flags[1:]:
+        problems.append('flags '+' '.join(af.flags)+', only the first molecule can be 1')
+    nmol = af.values.shape[1] if len(af.names) else af.nlay
+    if nmol != af.nlay:
+        problems.append('%d layers in the molecule blocks, %d in CONT' % (nmol,af.nlay))
+    if lay is not None and af.nlay != len(lay.ealt):
+        problems.append('%d layers, %d in %s' % (af.nlay,len(lay.ealt),lay.filename))
+
+    # Numeric ranges
+    for what,names,vals in (('mixing ratios',af.names,af.values),('CONT values',['CONT'],af.cont)):
+        problem = range_problem(what,names,vals)
+        if problem is not None:
+            problems.append(problem)
+
+    # Everything else depends on the type of file
+    if af.variant is None:
+        return problems
+    try:
+        kind,param = parse_variant(af.variant)
+    except ValueError as err:
+        problems.append(str(err))
+        return problems
+
+    if kind == 'reflectance':
+        if len(af.names) and af.nlay and np.any(af.values[:,0] != 0):
+            problems.append('first mixing ratios of a reflectance file are not 0')
+        if param is not None and af.params[TEMP_PARAM] != param:
+            problems.append('reference temperature %s, not %s' % (af.params[TEMP_PARAM],param))
+    elif lay is not None and len(lay.temp) and af.temp != float(lay.temp[-1]):
+        problems.append('reference temperature %s, not the lowest layer %s' % (af.params[TEMP_PARAM],float(lay.temp[-1])))
+
+    # CONT placement
+    if af.nlay:
+        expected,opacity = expected_cont(af,lay)
+        found = af.cont_layers().tolist()
+        if expected is None:
+            # Without the LAYERS file only the shape of a cloud can be checked
+            contiguous = len(found) > 0 and found[-1]-found[0] == len(found)-1
+            if not contiguous or (np.ndim(param) == 0 and len(found) != 1):
+                problems.append('CONT in layers %s' % [i+1 for i in found])
+        elif found != expected:
+            problems.append('CONT in layers %s, not %s' % ([i+1 for i in found],[i+1 for i in expected]))
+        if len(found) and np.any(af.cont[found] != opacity):
+            problems.append('CONT values %s, not %.2E' % (sorted(set(af.cont[found].tolist())),opacity))
+
+    if text is not None and af.document().text() != text:
+        problems.append('not written again exactly from its parsed data')
+
+    return problems
+
+
+def validate_model(task):
+
+    # Check all AUTOSPEC files of one LAYERS file, returns (filename, problems) of every file
+    layersfile,files,roundtrip = task
+
+    lay = None
+    results = []
+    if layersfile is not None:
+        try:
+            lay = LayersFile(layersfile)
+        except Exception as err:
+            results.append((layersfile,['LAYERS file unreadable: '+str(err)]))
+
+    parsed = []
+    for filename,text in files:
+        try:
+            if text is None and roundtrip:
+                with open(filename) as f:
+                    text = f.read()
+            af = AUTOSPECFile(filename,text)
+            problems = validate_file(af,lay,text if roundtrip else None)
+            parsed.append(af)
+        except Exception as err:
+            problems = ['unreadable: '+type(err).__name__+': '+str(err)]
+            logger.debug(traceback.format_exc())
+        results.append((filename,problems))
+
+    # Every file of one LAYERS file has the same molecules (apart from the first layer of
+    # reflectance files)
+    emission = [af for af in parsed if af.variant is not None and not af.variant.startswith('reflectance')]
+    problems = dict(results)
+    for af in parsed:
+        if len(emission) == 0 or af is emission[0] or af.variant is None:
+            continue
+        ref = emission[0]
+        first = 1 if af.variant.startswith('reflectance') else 0
+        if (af.names != ref.names or af.values.shape != ref.values.shape or
+            not np.array_equal(af.values[:,first:],ref.values[:,first:])):
+            problems[af.filename].append('molecules differ from '+os.path.basename(ref.filename))
+
+    return results
+
+
+def model_tasks(paths):
+
+    # Group consecutive files made from the same LAYERS file
+    model,files = None,[]
+    for filename,text in iter_sources(paths):
+        base = filename.split('_AUTOSPEC_',1)[0]
+        if base != model and len(files):
+            yield files
+            files = []
+        model = base
+        files.append((filename,text))
+    if len(files):
+        yield files
+
+
+def validate_AUTOSPEC(paths,workers=None,layers_dir=None,roundtrip=False):
+
+    if isinstance(paths,str):
+        paths = [paths]
+    if workers is None:
+        workers = 1
+
+    def tasks():
+        for files in model_tasks(paths):
+            layersfile = find_layers(files[0][0],layers_dir)
+            if layersfile is None:
+                logger.warning('No LAYERS file for %s, layers not checked',files[0][0])
+            yield layersfile,files,roundtrip
+
+    report = {}
+    nfiles = 0
+
+    def add(results):
+        nonlocal nfiles
+        for filename,problems in results:
+            nfiles += 1
+            if len(problems):
+                report[filename] = problems
+                for problem in problems:
+                    logger.warning('%s: %s',filename,problem)
+            else:
+                logger.debug('%s: OK',filename)
+
+    if workers == 1:
+        for task in tasks():
+            add(validate_model(task))
+    else:
+        # Only a few groups are waiting at once, so archives are streamed through the workers
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for task in tasks():
+                pending.add(pool.submit(validate_model,task))
+                if len(pending) >= 4*workers:
+                    done,pending = wait(pending,return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        add(fut.result())
+            for fut in pending:
+                add(fut.result())
+
+    logger.info('%d of %d AUTOSPEC files OK',nfiles-len(report),nfiles)
+
+    return report
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Check AUTOSPEC files, directories and archives')
+    parser.add_argument('paths',nargs='+',help='AUTOSPEC files, directories or archives')
+    parser.add_argument('--layers-dir',default=None,help='directory with the LAYERS files')
+    parser.add_argument('--jobs','-j',type=int,default=1,help='number of worker processes')
+    parser.add_argument('--roundtrip',action='store_true',help='check every file is written again exactly')
+    parser.add_argument('--json',default=None,help='write the problems to a JSON file')
+    parser.add_argument('--quiet','-q',action='store_true',help='only print warnings and errors')
+    parser.add_argument('--verbose','-v',action='store_true',help='print every file')
+    args = parser.parse_args(argv)
+
+    setup_logging(args.quiet,args.verbose)
+    report = validate_AUTOSPEC(args.paths,args.jobs,args.layers_dir,args.roundtrip)
+
+    if args.json is not None:
+        with open(args.json,'w') as f:
+            json.dump(report,f,indent=1)
+
+    return 1 if len(report) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())